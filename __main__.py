@@ -0,0 +1,6 @@
+"""Lets the checkout run as `python <checkout> report --range 30d` without starting the GUI."""
+import sys
+
+from cli import main
+
+sys.exit(main())
@@ -1,26 +1,179 @@
-from garminconnect import Garmin
-from dotenv import load_dotenv
+from datetime import timedelta
+import logging
 import os
+import threading
+import time
+
+from instrumentation import timed, timer
+
+logger = logging.getLogger(__name__)
+
+# Where the session tokens are kept between runs
+DEFAULT_TOKEN_DIR = os.path.expanduser(os.getenv('GARMIN_TOKEN_DIR', '~/.garminconnect'))
+# The files the client's dump() writes there; the directory may be shared, so
+# nothing else in it is touched
+TOKEN_FILES = ('garmin_tokens.json',)
+
+class RateLimiter:
+    """Spaces calls at least `min_interval` seconds apart."""
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.last_call = 0.0
+
+    def wait(self):
+        delay = self.last_call + self.min_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.last_call = time.monotonic()
 
 class GarminRequest:
-    def __init__(self):
+    # Days fetched per get_activities_by_date call during range requests;
+    # the client pages within a window itself, so bigger windows mean fewer calls
+    WINDOW_DAYS = 90
+    MIN_INTERVAL = 1.0
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 2.0
+
+    def __init__(self, token_dir=DEFAULT_TOKEN_DIR):
+        # Logging in is deferred until the first request, so the app starts
+        # instantly and still works offline for manual entry
+        self.token_dir = token_dir
+        self._client = None
+        self._login_lock = threading.Lock()
+        self.rate_limiter = RateLimiter(self.MIN_INTERVAL)
+
+    @property
+    def client(self):
+        with self._login_lock:
+            if self._client is None:
+                self._client = self._login()
+            return self._client
+
+    @timed('GarminRequest.login')
+    def _login(self):
+        """
+        Resumes the session saved in token_dir, refreshing it if it is about
+        to expire; falls back to logging in with credentials.
+        """
+        # Imported on first login; the client library is slow to import
+        from garminconnect import Garmin
+        from dotenv import load_dotenv
+
         load_dotenv()
         email = os.getenv('GARMIN_EMAIL')
         password = os.getenv('GARMIN_PASSWORD')
+        os.makedirs(self.token_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.token_dir, 0o700)
+        client = Garmin(email, password)
+        client.login(self.token_dir)
+        # Save after every login so refreshed tokens are kept too
+        client.client.dump(self.token_dir)
+        for path in self._token_paths():
+            os.chmod(path, 0o600)
+        return client
+
+    def _token_paths(self):
+        """Paths of the saved token files that exist."""
+        paths = [os.path.join(self.token_dir, name) for name in TOKEN_FILES]
+        return [path for path in paths if os.path.isfile(path)]
+
+    def logout(self):
+        """Forgets the session and its saved tokens; the next request logs in with credentials."""
+        with self._login_lock:
+            self._client = None
+            for path in self._token_paths():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
 
-        # Initialize Garmin client
-        self.client = Garmin(email, password)
-        self.client.login()
+    @staticmethod
+    def _parse(a):
+        # (activity_id, date as YYYY-MM-DD, name, duration in hours)
+        return (a["activityId"], a["startTimeLocal"][:10], a["activityName"], a["duration"] / 60 / 60)
 
+    @staticmethod
+    def _parse_details(payload):
+        # (average heart rate in bpm, max heart rate, distance in km, calories);
+        # None for whatever the activity type doesn't record
+        summary = payload["activity"].get("summaryDTO") or {}
+        distance = summary.get("distance")
+        return (summary.get("averageHR"), summary.get("maxHR"),
+                None if distance is None else distance / 1000, summary.get("calories"))
+
+    @timed()
+    def request_details(self, activity_id):
+        """
+        Fetches everything Garmin has on one activity: the activity itself
+        and its splits, as payload {'activity': ..., 'splits': ...}.
+        Returns Tuple(payload, average_hr, max_hr, distance_km, calories)
+        """
+        payload = {
+            "activity": self._call("get_activity", activity_id),
+            "splits": self._call("get_activity_splits", activity_id),
+        }
+        return (payload,) + self._parse_details(payload)
+
+    @timed()
     def request_date(self, date):
         """
         Input date datetime format
-        Returns List[Tuple(name, duration)]
+        Returns List[Tuple(activity_id, date, name, duration)]
+        """
+        return [self._parse(a) for a in self._get_activities(date, date)]
+
+    def iter_range(self, start, end):
+        """
+        Fetches start..end (inclusive dates) in windows of WINDOW_DAYS.
+        Yields (window_index, window_count, List[Tuple(activity_id, date, name, duration)])
+        with the date as YYYY-MM-DD and duration in hours.
+        """
+        window = timedelta(days=self.WINDOW_DAYS)
+        window_count = (end - start).days // self.WINDOW_DAYS + 1
+        window_start = start
+        for index in range(window_count):
+            window_end = min(window_start + window - timedelta(days=1), end)
+            activities = self._get_activities(window_start, window_end)
+            yield index, window_count, [self._parse(a) for a in activities]
+            window_start = window_end + timedelta(days=1)
+
+    def request_range(self, start, end):
+        """
+        Input start and end dates, inclusive
+        Returns List[Tuple(activity_id, date, name, duration)]
         """
-        activities = self.client.get_activities_by_date(date.isoformat(), date.isoformat())
-        print(activities)
         res = []
-        for a in activities:
-            res.append((a["activityName"], a["duration"] / 60 / 60))
+        for _, _, activities in self.iter_range(start, end):
+            res.extend(activities)
         return res
 
+    def _get_activities(self, start, end):
+        return self._call("get_activities_by_date", start.isoformat(), end.isoformat())
+
+    def _call(self, method, *args):
+        """Calls client.<method>(*args), rate limited, logging in again or retrying as needed."""
+        from garminconnect import (
+            GarminConnectAuthenticationError,
+            GarminConnectConnectionError,
+            GarminConnectTooManyRequestsError,
+        )
+
+        for attempt in range(self.MAX_RETRIES):
+            self.rate_limiter.wait()
+            try:
+                client = self.client
+                # Only the round trip is timed; login and rate limiting have their own
+                with timer(f'GarminRequest.{method}'):
+                    return getattr(client, method)(*args)
+            except GarminConnectAuthenticationError:
+                # Session rejected: log in again once, then give up
+                if attempt > 0:
+                    raise
+                logger.warning("Garmin session rejected, logging in again")
+                self.logout()
+            except (GarminConnectTooManyRequestsError, GarminConnectConnectionError) as e:
+                if attempt == self.MAX_RETRIES - 1:
+                    raise
+                delay = self.BACKOFF_BASE * 2 ** attempt
+                logger.warning("Garmin request failed (%s), retrying in %.0fs", e, delay)
+                time.sleep(delay)
@@ -0,0 +1,53 @@
+class GarminSync:
+    """
+    Copies Garmin activities into the DataManager.
+
+    Every activity is keyed by its Garmin activityId (stored as source_id), so
+    syncing the same day or range again updates rows in place instead of
+    inserting duplicates. Jobs take a task with `cancelled` and
+    `report(done, total)` (see ui.background.Task), or None when run directly.
+    """
+    def __init__(self, garminRequest, data_manager):
+        self.garminRequest = garminRequest
+        self.data_manager = data_manager
+
+    @staticmethod
+    def to_records(activities):
+        # Garmin activities are stored with the activity name as the category
+        return [(activity_id, record_date, "", duration, name)
+                for activity_id, record_date, name, duration in activities]
+
+    def sync_day(self, task, day):
+        """Syncs one date. Returns the number of activities synced."""
+        activities = self.garminRequest.request_date(day)
+        if task is not None and task.cancelled:
+            return 0
+        synced = self.data_manager.upsert_activities(self.to_records(activities))
+        if task is not None:
+            task.report(1, 1)
+        return synced
+
+    def backfill(self, task, start, end):
+        """
+        Syncs start..end (inclusive dates) one request window at a time, so a
+        cancel keeps the windows already written. Returns the number synced.
+        """
+        synced = 0
+        for index, window_count, activities in self.garminRequest.iter_range(start, end):
+            synced += self.data_manager.upsert_activities(self.to_records(activities))
+            if task is not None:
+                task.report(index + 1, window_count)
+                if task.cancelled:
+                    break
+        return synced
+
+    def fetch_details(self, task, source_id):
+        """
+        Downloads the full details of one synced activity and stores them.
+        Returns the stored DataManager.ActivityDetails, or None if cancelled.
+        """
+        payload, average_hr, max_hr, distance_km, calories = self.garminRequest.request_details(source_id)
+        if task is not None and task.cancelled:
+            return None
+        self.data_manager.save_activity_details(source_id, payload, average_hr, max_hr, distance_km, calories)
+        return self.data_manager.get_activity_details(source_id)
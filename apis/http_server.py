@@ -0,0 +1,285 @@
+"""
+Read-only HTTP/JSON API over the activity store, for dashboards and scripts.
+
+    python cli.py serve --port 8765
+
+Built on asyncio streams, so it needs nothing beyond the standard library.
+Queries run on a small thread pool against a DataManager opened read-only,
+so the server can run next to the Tk app without ever taking the write lock.
+
+Endpoints (all GET, dates as YYYY-MM-DD):
+    /dates                                   dates with records, newest first
+    /activities?date=                        records of one date
+    /activities?start=&end=                  records of a range
+    /activities/grouped?start=[&end=]        {category: [[activity, hours]]}
+    /categories[?q=&limit=]                  every category, or the best matches for q
+    /daily-totals?start=&end=                hours per date and category
+    /summary?start=&end=[&granularity=&categories=a,b]
+    /detail-totals?start=&end=               distance, calories and heart rate per category,
+                                             from the Garmin details fetched so far
+    /version                                 the current data version
+
+Every response carries an ETag derived from the data version, and requests
+whose If-None-Match still matches get an empty 304. Bodies of at least
+GZIP_MIN_BYTES are gzipped for clients that accept it.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+GZIP_MIN_BYTES = 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+MAX_HEADERS = 100
+
+def _date(params, name, default=None):
+    value = params.get(name, default)
+    if value is None:
+        raise ValueError(f"Missing parameter {name!r}")
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"Parameter {name!r} must be a YYYY-MM-DD date") from None
+
+def _range(params):
+    start, end = _date(params, 'start'), _date(params, 'end')
+    if start > end:
+        raise ValueError("'end' is before 'start'")
+    return start, end
+
+def get_dates(data_manager, params):
+    return data_manager.get_dates()
+
+def get_activities(data_manager, params):
+    if 'date' in params:
+        selected_date = _date(params, 'date').isoformat()
+        rows = data_manager.get_activities_by_date(selected_date)
+        return [{'id': activity_id, 'date': selected_date, 'activity': activity,
+                 'category': category, 'hours': duration, 'source_id': source_id}
+                for activity_id, activity, category, duration, source_id in rows]
+    start, end = _range(params)
+    return [{'date': record_date, 'activity': activity, 'category': category, 'hours': duration}
+            for record_date, activity, category, duration in data_manager.get_activities_in_range(start, end)]
+
+def get_grouped(data_manager, params):
+    start = _date(params, 'start', params.get('date'))
+    end = _date(params, 'end', start)
+    if start > end:
+        raise ValueError("'end' is before 'start'")
+    return data_manager.get_activities_grouped_by_category(start.isoformat(), end.isoformat())
+
+def get_categories(data_manager, params):
+    if 'q' not in params:
+        return data_manager.get_categories()
+    try:
+        limit = int(params['limit']) if 'limit' in params else None
+    except ValueError:
+        raise ValueError("Parameter 'limit' must be an integer") from None
+    return data_manager.search_categories(params['q'], limit)
+
+def get_daily_totals(data_manager, params):
+    start, end = _range(params)
+    return [{'date': record_date, 'category': category, 'hours': hours}
+            for record_date, category, hours in data_manager.get_daily_totals(start, end)]
+
+def get_summary(data_manager, params):
+    start, end = _range(params)
+    granularity = params.get('granularity', 'day')
+    categories = params['categories'].split(',') if 'categories' in params else None
+    summary = data_manager.get_summary(start, end, granularity=granularity, categories=categories)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'periods': summary.periods,
+        'categories': summary.categories,
+        'values': summary.values.tolist(),
+    }
+
+def get_detail_totals(data_manager, params):
+    start, end = _range(params)
+    return [{'category': category, 'activities': activities, 'distance_km': distance_km,
+             'calories': calories, 'average_hr': average_hr}
+            for category, activities, distance_km, calories, average_hr
+            in data_manager.get_detail_totals(start, end)]
+
+def get_version(data_manager, params):
+    return {'data_version': data_manager.data_version()}
+
+# path -> function(data_manager, params) returning JSON-ready data
+ROUTES = {
+    '/dates': get_dates,
+    '/activities': get_activities,
+    '/activities/grouped': get_grouped,
+    '/categories': get_categories,
+    '/daily-totals': get_daily_totals,
+    '/summary': get_summary,
+    '/detail-totals': get_detail_totals,
+    '/version': get_version,
+}
+
+class HTTPServer:
+    """
+    Serves ROUTES from a DataManager, which should be opened with
+    read_only=True. Connections are handled on the event loop; queries and
+    encoding run on `workers` threads, one per pooled SQLite connection.
+    Encoded bodies are kept per request target and data version, so repeated
+    requests for the same data skip the query and the compression.
+    """
+    def __init__(self, data_manager, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, cache_size=256):
+        self.data_manager = data_manager
+        self.host = host
+        self.port = port
+        self.workers = workers or data_manager.connections.pool_size
+        self.cache_size = cache_size
+        # Data versions restart with the process, so ETags carry a per-run token too
+        self.instance = os.urandom(4).hex()
+        self._executor = None
+        self._bodies = OrderedDict()  # (target, version) -> [json bytes, gzip bytes or None]
+        self._bodies_lock = threading.Lock()
+
+    async def serve_forever(self):
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='http-query')
+        try:
+            server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+            async with server:
+                logger.info("Serving on http://%s:%d", self.host, self.port)
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        asyncio.run(self.serve_forever())
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                if request is None:
+                    break
+                method, target, keep_alive, headers = request
+                status, response_headers, body = await self._respond(method, target, headers)
+                self._write_response(writer, status, response_headers, b'' if method == 'HEAD' else body,
+                                     len(body), keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError:
+            # Header line over the StreamReader limit, or an unparsable request
+            self._write_response(writer, HTTPStatus.BAD_REQUEST, {}, b'', 0, False)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Returns (method, target, keep_alive, headers), or None once the client hangs up."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise ValueError("Malformed request line")
+        method, target, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ValueError("Too many headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers or 'transfer-encoding' in headers:
+            # Nothing here takes a request body
+            raise ValueError("Request bodies are not supported")
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        return method, target, keep_alive, headers
+
+    @staticmethod
+    def _write_response(writer, status, headers, body, length, keep_alive):
+        status = HTTPStatus(status)
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}',
+                 f'Content-Length: {length}',
+                 f'Connection: {"keep-alive" if keep_alive else "close"}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def _respond(self, method, target, headers):
+        """Returns (status, headers, body) for one request."""
+        url = urlsplit(target)
+        route = ROUTES.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return self._error(HTTPStatus.NOT_FOUND, f"No endpoint {url.path}")
+        if method not in ('GET', 'HEAD'):
+            status, response_headers, body = self._error(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed")
+            response_headers['Allow'] = 'GET, HEAD'
+            return status, response_headers, body
+
+        # Read before querying: if a write lands mid-query the body is newer
+        # than its ETag, and the next request just gets a fresh copy. It runs
+        # a PRAGMA under a lock, so it goes to the workers like the queries
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(self._executor, self.data_manager.data_version)
+        etag = f'W/"{self.instance}-{version}"'
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if_none_match = headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in
+                              (tag.strip() for tag in if_none_match.split(','))):
+            return HTTPStatus.NOT_MODIFIED, response_headers, b''
+
+        use_gzip = 'gzip' in headers.get('accept-encoding', '').lower()
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body, gzipped = await loop.run_in_executor(
+                self._executor, self._render, route, params, (target, version), use_gzip)
+        except ValueError as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except Exception:
+            logger.exception("Error serving %s", target)
+            return self._error(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal error")
+        response_headers['Content-Type'] = 'application/json'
+        if gzipped:
+            response_headers['Content-Encoding'] = 'gzip'
+        return HTTPStatus.OK, response_headers, body
+
+    def _render(self, route, params, key, use_gzip):
+        """Runs on a worker thread. Returns (body, gzipped)."""
+        with self._bodies_lock:
+            entry = self._bodies.get(key)
+            if entry is not None:
+                self._bodies.move_to_end(key)
+        if entry is None:
+            with timer(f'HTTP {route.__name__}'):
+                data = route(self.data_manager, params)
+            entry = [json.dumps(data, separators=(',', ':')).encode('utf-8'), None]
+            with self._bodies_lock:
+                self._bodies[key] = entry
+                while len(self._bodies) > self.cache_size:
+                    self._bodies.popitem(last=False)
+        body = entry[0]
+        if not use_gzip or len(body) < GZIP_MIN_BYTES:
+            return body, False
+        if entry[1] is None:
+            entry[1] = gzip.compress(body, compresslevel=6)
+        return entry[1], True
+
+    @staticmethod
+    def _error(status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        return status, {'Content-Type': 'application/json'}, body
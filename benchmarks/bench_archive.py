@@ -0,0 +1,83 @@
+"""
+Compares DataManager reads and the main database's size with all history in
+one file against the same data after archive_year moves every closed year
+into its own file.
+
+    python -m benchmarks.bench_archive --rows 1000000 --years 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.suite import cold, measure
+from benchmarks.synthetic import populate
+from data.data_manager import DataManager
+
+
+def read_benchmarks(data_manager, repeat):
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    c = cold(data_manager)
+    benchmarks = {
+        # Hot path: only ever the current year
+        'get_today_activities_grouped_by_category': (data_manager.get_today_activities_grouped_by_category, c),
+        'get_activities_grouped_by_category[week]': (
+            lambda: data_manager.get_activities_grouped_by_category(str(monday), str(today)), c),
+        'get_activities_by_date[today]': (lambda: data_manager.get_activities_by_date(str(today)), c),
+        'get_last_7_days_summary': (data_manager.get_last_7_days_summary, c),
+        # Spanning archives
+        'get_last_365_days_summary': (data_manager.get_last_365_days_summary, c),
+        'get_summary[3y,month]': (lambda: data_manager.get_summary(today - timedelta(days=3 * 365), today,
+                                                                  granularity='month'), c),
+        'get_daily_totals[365d]': (lambda: data_manager.get_daily_totals(today - timedelta(days=365), today), c),
+        'get_dates': (data_manager.get_dates, c),
+        'export_activities[all]': (lambda: sum(len(batch) for batch in data_manager.export_activities()), None),
+    }
+    return {name: measure(fn, repeat, setup) for name, (fn, setup) in benchmarks.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single = os.path.join(tmp, 'single.db')
+        archived = os.path.join(tmp, 'archived.db')
+        print(f"Populating {args.rows:,} rows over {args.years} years...")
+        populate(single, args.rows, args.years)
+        shutil.copyfile(single, archived)
+
+        data_manager = DataManager(single)
+        data_manager.vacuum()
+        size_before = os.path.getsize(single)
+        before = read_benchmarks(data_manager, args.repeat)
+        data_manager.close()
+
+        data_manager = DataManager(archived)
+        start = time.perf_counter()
+        first = min(data_manager.get_dates())[:4]
+        for year in range(int(first), date.today().year):
+            data_manager.archive_year(year, read_only=True)
+        data_manager.vacuum()
+        archive_seconds = time.perf_counter() - start
+        size_after = os.path.getsize(archived)
+        archive_sizes = sum(os.path.getsize(path) for year, path, rows, read_only in data_manager.get_archives())
+        after = read_benchmarks(data_manager, args.repeat)
+        data_manager.close()
+
+    print(f"\narchiving: {archive_seconds:.1f} s")
+    print(f"main database: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB, "
+          f"plus {archive_sizes / 2**20:.1f} MiB of archives")
+    for name in before:
+        t_before, t_after = before[name]['median_ms'], after[name]['median_ms']
+        print(f"{name}: {t_before:.2f} ms -> {t_after:.2f} ms ({t_before / max(t_after, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compares query plans and timings of the DataManager read queries before and
+after the schema migrations add the activities indexes (migrations 1 and 2,
+on the text-keyed schema they were written for).
+
+    python -m benchmarks.bench_indexes --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from data.data_manager import MIGRATIONS
+
+QUERIES = {
+    'get_activities_by_date': (
+        'SELECT activity, category, duration FROM activities WHERE date=?',
+        lambda today: (str(today - timedelta(days=3)),),
+    ),
+    'get_today_activities_grouped_by_category': (
+        'SELECT category, activity, SUM(duration) FROM activities WHERE date=? GROUP BY category, activity',
+        lambda today: (str(today),),
+    ),
+    'get_dates': (
+        'SELECT DISTINCT date FROM activities ORDER BY date DESC',
+        lambda today: (),
+    ),
+    'get_last_30_days_summary': (
+        'SELECT date, category, SUM(duration) FROM activities WHERE date >= ? GROUP BY date, category ORDER BY date ASC',
+        lambda today: (str(today - timedelta(days=30)),),
+    ),
+    'get_last_365_days_summary': (
+        'SELECT date, category, SUM(duration) FROM activities WHERE date >= ? GROUP BY date, category ORDER BY date ASC',
+        lambda today: (str(today - timedelta(days=365)),),
+    ),
+}
+
+
+def populate(path, rows, days, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    categories = [f"category {i}" for i in range(20)]
+    activities = [f"activity {i}" for i in range(200)]
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE activities (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            category TEXT,
+            activity TEXT,
+            duration REAL
+        )
+    ''')
+    with conn:
+        conn.executemany(
+            'INSERT INTO activities (date, category, activity, duration) VALUES (?, ?, ?, ?)',
+            ((str(today - timedelta(days=rng.randrange(days))), rng.choice(categories),
+              rng.choice(activities), round(rng.uniform(0.1, 3), 2)) for _ in range(rows)),
+        )
+    conn.close()
+
+
+def apply_migrations(conn, start, stop):
+    """Applies MIGRATIONS[start:stop] the way DataManager.migrate does."""
+    for version in range(start, stop):
+        with conn:
+            conn.execute('BEGIN')
+            migration = MIGRATIONS[version]
+            if callable(migration):
+                migration(conn)
+            else:
+                for statement in migration:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+
+
+def run_queries(conn, repeat):
+    today = date.today()
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        args = params(today)
+        plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, args)]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, args).fetchall()
+        results[name] = ((time.perf_counter() - start) / repeat, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f"Populating {args.rows} rows over {args.days} days...")
+        populate(path, args.rows, args.days)
+
+        conn = sqlite3.connect(path)
+        before = run_queries(conn, args.repeat)
+        apply_migrations(conn, 0, 2)
+        after = run_queries(conn, args.repeat)
+        conn.close()
+
+    for name in QUERIES:
+        (t_before, plan_before), (t_after, plan_after) = before[name], after[name]
+        print(f"\n{name}: {t_before * 1000:.1f} ms -> {t_after * 1000:.1f} ms "
+              f"({t_before / max(t_after, 1e-9):.1f}x)")
+        print(f"  before: {'; '.join(plan_before)}")
+        print(f"  after:  {'; '.join(plan_after)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compares file size and read-query timings of the activities table keyed by
+category and activity text (schema version 6) with the same rows after
+normalize_activities replaces them with integer ids (migration 7).
+
+    python -m benchmarks.bench_normalize --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.bench_indexes import apply_migrations
+from benchmarks.synthetic import generate
+
+# name -> (text-keyed SQL, id-keyed SQL, params(today)); each pair returns the same rows
+QUERIES = {
+    'activities_by_date': (
+        'SELECT activity, category, duration FROM activities WHERE date=? ORDER BY id',
+        '''SELECT n.name, c.name, a.duration FROM activities a
+           JOIN activity_names n ON n.id = a.activity_name_id
+           JOIN categories c ON c.id = a.category_id
+           WHERE a.date=? ORDER BY a.id''',
+        lambda today: (str(today - timedelta(days=3)),),
+    ),
+    'grouped_by_category_30_days': (
+        '''SELECT category, activity, SUM(duration) FROM activities
+           WHERE date BETWEEN ? AND ? GROUP BY category, activity ORDER BY category, activity''',
+        '''SELECT c.name, n.name, t.hours FROM (
+               SELECT category_id, activity_name_id, SUM(duration) AS hours FROM activities
+               WHERE date BETWEEN ? AND ? GROUP BY category_id, activity_name_id
+           ) t
+           JOIN categories c ON c.id = t.category_id
+           JOIN activity_names n ON n.id = t.activity_name_id
+           ORDER BY c.name, n.name''',
+        lambda today: (str(today - timedelta(days=30)), str(today)),
+    ),
+    'daily_totals_365_days': (
+        'SELECT date, category, duration FROM daily_category_totals WHERE date BETWEEN ? AND ?',
+        '''SELECT t.date, c.name, t.duration FROM daily_category_totals t
+           JOIN categories c ON c.id = t.category_id
+           WHERE t.date BETWEEN ? AND ?''',
+        lambda today: (str(today - timedelta(days=365)), str(today)),
+    ),
+    'export_all': (
+        'SELECT date, category, activity, duration, source_id FROM activities ORDER BY date, id',
+        '''SELECT a.date, c.name, n.name, a.duration, a.source_id FROM activities a
+           JOIN categories c ON c.id = a.category_id
+           JOIN activity_names n ON n.id = a.activity_name_id
+           ORDER BY a.date, a.id''',
+        lambda today: (),
+    ),
+}
+
+
+def populate(path, rows, years, seed=0):
+    """Builds a schema version 6 database (text keys) filled with synthetic rows."""
+    conn = sqlite3.connect(path)
+    # The tables DataManager.create_tables makes before any migration
+    conn.execute('''
+        CREATE TABLE activities (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            category TEXT,
+            activity TEXT,
+            duration REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE
+        )
+    ''')
+    apply_migrations(conn, 0, 6)
+    with conn:
+        conn.executemany(
+            'INSERT INTO activities (date, activity, duration, category) VALUES (?, ?, ?, ?)',
+            generate(rows, years, seed=seed),
+        )
+        conn.execute('INSERT OR IGNORE INTO categories (name) SELECT DISTINCT category FROM activities')
+    return conn
+
+
+def file_size(conn, path):
+    conn.execute('VACUUM')
+    return os.path.getsize(path)
+
+
+def run_queries(conn, column, repeat):
+    today = date.today()
+    results = {}
+    for name, queries in QUERIES.items():
+        sql, args = queries[column], queries[2](today)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            rows = conn.execute(sql, args).fetchall()
+        results[name] = ((time.perf_counter() - start) / repeat, rows)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f"Populating {args.rows} rows over {args.years} years...")
+        conn = populate(path, args.rows, args.years)
+        size_before = file_size(conn, path)
+        before = run_queries(conn, 0, args.repeat)
+
+        start = time.perf_counter()
+        apply_migrations(conn, 6, 7)
+        migration_seconds = time.perf_counter() - start
+        size_after = file_size(conn, path)
+        after = run_queries(conn, 1, args.repeat)
+        conn.close()
+
+    print(f"\nmigration: {migration_seconds:.1f} s")
+    print(f"file size: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB "
+          f"({1 - size_after / size_before:.0%} smaller)")
+    for name in QUERIES:
+        (t_before, rows_before), (t_after, rows_after) = before[name], after[name]
+        same = len(rows_before) == len(rows_after) and all(
+            a[:-1] == b[:-1] if name == 'daily_totals_365_days' else a == b
+            for a, b in zip(sorted(rows_before), sorted(rows_after)))
+        print(f"{name}: {t_before * 1000:.1f} ms -> {t_after * 1000:.1f} ms "
+              f"({t_before / max(t_after, 1e-9):.1f}x){'' if same else '  RESULTS DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
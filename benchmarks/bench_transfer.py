@@ -0,0 +1,70 @@
+"""
+Measures import/export throughput of DataManager through data.transfer.
+
+    python -m benchmarks.bench_transfer --rows 10000000 --formats csv jsonl parquet
+
+--chunked imports as the Edit tab does, committing every --chunk-size rows.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from data.data_manager import DataManager
+from data.transfer import read_records, write_records
+
+
+def synthetic_batches(rows, batch_size, seed=0):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=10 * 365)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(10 * 365)]
+    categories = [f"category {i}" for i in range(30)]
+    activities = [f"activity {i}" for i in range(500)]
+    for offset in range(0, rows, batch_size):
+        yield [(rng.choice(dates), rng.choice(categories), rng.choice(activities),
+                round(rng.uniform(0.1, 3), 2), None)
+               for _ in range(min(batch_size, rows - offset))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--formats', nargs='+', default=['csv', 'jsonl', 'parquet'])
+    parser.add_argument('--chunked', action='store_true', help="Commit each chunk instead of one transaction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            source = os.path.join(tmp, f'source.{fmt}')
+            try:
+                write_records(source, synthetic_batches(args.rows, args.chunk_size), fmt)
+            except ImportError as e:
+                print(f"{fmt}: skipped ({e})")
+                continue
+            size_mb = os.path.getsize(source) / 1e6
+
+            db_path = os.path.join(tmp, f'{fmt}.db')
+            data_manager = DataManager(db_path)
+            start = time.perf_counter()
+            count = data_manager.import_activities(read_records(source, fmt), chunk_size=args.chunk_size,
+                                                   atomic=not args.chunked)
+            import_s = time.perf_counter() - start
+
+            target = os.path.join(tmp, f'export.{fmt}')
+            start = time.perf_counter()
+            exported = write_records(target, data_manager.export_activities(batch_size=args.chunk_size), fmt)
+            export_s = time.perf_counter() - start
+            data_manager.close()
+
+            print(f"{fmt:8} {size_mb:8.0f} MB  import {count:,} rows in {import_s:6.1f}s "
+                  f"({count / import_s:,.0f}/s)  export {exported:,} rows in {export_s:6.1f}s "
+                  f"({exported / export_s:,.0f}/s)")
+            os.remove(source)
+            os.remove(target)
+
+
+if __name__ == "__main__":
+    main()
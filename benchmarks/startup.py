@@ -0,0 +1,62 @@
+"""
+Checks the app's import cost against a budget using `python -X importtime`.
+
+    python -m benchmarks.startup [--budget-ms 150]
+
+Exits non-zero if importing main takes longer than the budget, or if it pulls
+in a module that should only load once a chart is shown or Garmin is used.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported before they are needed
+DEFERRED = ['matplotlib', 'numpy', 'garminconnect', 'dotenv']
+
+
+def measure_imports(code):
+    """Returns {module: cumulative_microseconds} for every import made running `code`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=150.0)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # Modules the interpreter loads on its own (site, .pth hooks) are not ours
+    interpreter = measure_imports('pass')
+    runs = [measure_imports('import main') for _ in range(args.runs)]
+    # Take the fastest run to keep noise from other processes out of it
+    best = min(runs, key=lambda times: times['main'])
+    best = {name: micros for name, micros in best.items() if name not in interpreter}
+    total_ms = best['main'] / 1000
+    print(f"import main: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, micros in sorted(best.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failed = False
+    leaked = sorted(name for name in best if name.split('.')[0] in DEFERRED)
+    if leaked:
+        print(f"FAIL: imported at startup: {', '.join(leaked)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("FAIL: over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
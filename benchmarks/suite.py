@@ -0,0 +1,370 @@
+"""
+Times every DataManager method, sync-style bulk writes and off-screen chart
+rendering on synthetic databases, and stores the results as JSON.
+
+    python -m benchmarks.suite --sizes 10000 100000 1000000
+    python -m benchmarks.suite --compare benchmarks/results/<commit>.json
+
+Results go to benchmarks/results/<commit>.json, which git ignores, unless
+--output is given.
+With --compare, benchmarks slower than the baseline by more than
+--threshold are listed and the exit status is 1.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.synthetic import populate
+from data.data_manager import DataManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Runs fn(*setup()) `repeat` times; setup is not timed.
+    Returns {'min_ms', 'median_ms', 'mean_ms'}.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': min(times), 'median_ms': statistics.median(times), 'mean_ms': statistics.fmean(times)}
+
+
+def cold(data_manager):
+    """Setup that empties the query cache, so reads hit SQLite."""
+    def setup():
+        data_manager.cache.clear()
+        return ()
+    return setup
+
+
+def warm(data_manager, fn):
+    """Setup that runs fn once first, so the timed call is a cache hit."""
+    def setup():
+        data_manager.cache.clear()
+        fn()
+        return ()
+    return setup
+
+
+def add_details(data_manager, start, every=50):
+    """
+    Marks every `every`-th activity from start on as imported from Garmin and
+    stores details for it, so get_detail_totals has rows to join.
+    """
+    with data_manager.connections.transaction() as conn:
+        conn.execute('UPDATE activities SET source_id = id WHERE date >= ? AND id % ? = 0', (str(start), every))
+        source_ids = [row[0] for row in conn.execute('SELECT source_id FROM activities WHERE source_id IS NOT NULL')]
+    for source_id in source_ids:
+        data_manager.save_activity_details(source_id, {'activity': {'activityId': source_id}, 'splits': []},
+                                           average_hr=120 + source_id % 40, max_hr=170, distance_km=5.0,
+                                           calories=300)
+    data_manager.cache.clear()
+
+
+def newest_id(data_manager, day):
+    data_manager.add_activity(day, "bench activity", 1.0, "bench category")
+    return data_manager.get_activities_by_date(day)[-1][0]
+
+
+def data_manager_benchmarks(data_manager, repeat, end):
+    """Times the DataManager methods, with query windows ending at `end`, the last day of the data."""
+    day = str(end - timedelta(days=3))
+    month_ago = end - timedelta(days=30)
+    year_ago = end - timedelta(days=365)
+    c = cold(data_manager)
+    source_ids = iter(range(10**9, 2 * 10**9))
+    add_details(data_manager, year_ago)
+
+    def sync_batch():
+        # A Garmin window: new activities with ids never seen before
+        return ([(next(source_ids), str(end - timedelta(days=i % 90)), f"activity {i % 50}", 0.75, "")
+                 for i in range(1000)],)
+
+    def resync_batch():
+        # The same window synced again: every record updates in place
+        records, = sync_batch()
+        data_manager.upsert_activities(records)
+        return ([(source_id, record_date, activity, duration + 0.25, category)
+                 for source_id, record_date, activity, duration, category in records],)
+
+    bulk = [(str(end - timedelta(days=i % 30)), f"activity {i % 50}", 0.5, f"category {i % 40}")
+            for i in range(1000)]
+    benchmarks = {
+        # Reads, with the cache emptied first
+        # The "today" and "last N days" reads, as of the data's last day
+        'get_today_activities_grouped_by_category': (
+            lambda: data_manager.get_activities_grouped_by_category(str(end)), c),
+        'get_activities_grouped_by_category[30d]': (
+            lambda: data_manager.get_activities_grouped_by_category(month_ago, end), c),
+        'get_dates': (data_manager.get_dates, c),
+        'get_activities_by_date': (lambda: data_manager.get_activities_by_date(day), c),
+        'get_activities_in_range[30d]': (lambda: data_manager.get_activities_in_range(month_ago, end), c),
+        'get_last_7_days_summary': (lambda: data_manager._summary_since(end - timedelta(days=7)), c),
+        'get_last_30_days_summary': (lambda: data_manager._summary_since(end - timedelta(days=30)), c),
+        'get_last_365_days_summary': (lambda: data_manager._summary_since(end - timedelta(days=365)), c),
+        'get_summary[365d,week]': (lambda: data_manager.get_summary(year_ago, end, granularity='week'), c),
+        'get_summary[365d,month]': (lambda: data_manager.get_summary(year_ago, end, granularity='month'), c),
+        'get_daily_totals[365d]': (lambda: data_manager.get_daily_totals(year_ago, end), c),
+        'get_detail_totals[365d]': (lambda: data_manager.get_detail_totals(year_ago, end), c),
+        'get_categories': (data_manager.get_categories, c),
+        'get_category_groups': (data_manager.get_category_groups, c),
+        'search_categories': (lambda: data_manager.search_categories("cat", limit=50), None),
+        'data_version': (data_manager.data_version, None),
+        'export_activities[30d]': (lambda: sum(len(batch) for batch in
+                                               data_manager.export_activities(month_ago, end)), None),
+        # The same reads served from the cache, filled by an untimed call first
+        'get_last_30_days_summary[cached]': (
+            lambda: data_manager._summary_since(end - timedelta(days=30)),
+            warm(data_manager, lambda: data_manager._summary_since(end - timedelta(days=30)))),
+        'get_summary[365d,month,cached]': (
+            lambda: data_manager.get_summary(year_ago, end, granularity='month'),
+            warm(data_manager, lambda: data_manager.get_summary(year_ago, end, granularity='month'))),
+        # Single-row writes
+        'add_activity': (lambda: data_manager.add_activity(day, "bench activity", 1.0, "bench category"), None),
+        'add_today_activity': (lambda: data_manager.add_today_activity("bench category", "bench activity", 1.0),
+                               None),
+        'edit_activity': (lambda: data_manager.edit_activity(day, "bench activity", 2.0), None),
+        'edit_activity_by_id': (lambda activity_id: data_manager.edit_activity_by_id(
+            activity_id, "bench activity", 1.5, "bench category"), lambda: (newest_id(data_manager, day),)),
+        'remove_activity_by_id': (data_manager.remove_activity_by_id, lambda: (newest_id(data_manager, day),)),
+        'remove_activity': (lambda: data_manager.remove_activity(day, "bench activity", 2.0), None),
+        'add_category': (lambda: data_manager.add_category(f"bench category {time.perf_counter_ns()}"), None),
+        # Sync-style bulk writes of 1000 records
+        'add_activities_bulk[1000]': (lambda: data_manager.add_activities_bulk(bulk), None),
+        'upsert_activities[1000,new]': (data_manager.upsert_activities, sync_batch),
+        'upsert_activities[1000,update]': (data_manager.upsert_activities, resync_batch),
+        'import_activities[1000]': (lambda: data_manager.import_activities(
+            (record_date, activity, duration, category, None) for record_date, activity, duration, category in bulk),
+            None),
+        # Maintenance, run last as they touch the whole table
+        'check_daily_totals': (data_manager.check_daily_totals, None),
+        'rebuild_daily_totals': (data_manager.rebuild_daily_totals, None),
+    }
+    return {name: measure(fn, repeat, setup) for name, (fn, setup) in benchmarks.items()}
+
+
+def chart_benchmarks(data_manager, repeat, end):
+    """Renders the Home and Summary tab charts on an Agg canvas, as the tabs do, for data ending at `end`."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from ui.charts import StackedBarChart, draw_summary
+
+    figure = Figure(figsize=(5, 4), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    day_data = data_manager.get_activities_grouped_by_category(str(end - timedelta(days=3)))
+    month_data = data_manager.get_activities_grouped_by_category(end - timedelta(days=30), end)
+    summaries = {(days, granularity): data_manager.get_summary(end - timedelta(days=days), end,
+                                                               granularity=granularity)
+                 for days, granularity in ((30, 'day'), (365, 'week'), (365, 'day'))}
+
+    def fresh_chart():
+        return (StackedBarChart(ax, 'Stacked Time Spent Today by Categories'),)
+
+    def drawn_chart():
+        chart, = fresh_chart()
+        chart.update(day_data)
+        canvas.draw()
+        return (chart,)
+
+    def draw_stacked(chart, data=day_data):
+        chart.update(data)
+        canvas.draw()
+
+    def blitted_chart():
+        # A figure of its own, as the chart stays connected to its canvas' draw_event
+        blit_figure = Figure(figsize=(5, 4), dpi=100)
+        blit_canvas = FigureCanvasAgg(blit_figure)
+        chart = StackedBarChart(blit_figure.add_subplot(111), 'Stacked Time Spent Today by Categories', blit=True)
+        chart.update(day_data)
+        chart.draw(blit_canvas)
+        return (chart, blit_canvas)
+
+    def blit_stacked(chart, blit_canvas):
+        chart.update(day_data)
+        chart.draw(blit_canvas)
+
+    def draw_summary_chart(summary):
+        draw_summary(ax, summary, 'Summary')
+        canvas.draw()
+
+    benchmarks = {
+        # HomeTab.update_chart: first draw builds the artists, later ones move them
+        'home_chart[build]': (draw_stacked, fresh_chart),
+        'home_chart[update]': (draw_stacked, drawn_chart),
+        'home_chart[update,blit]': (blit_stacked, blitted_chart),
+        'home_chart[30d,build]': (lambda chart: draw_stacked(chart, month_data), fresh_chart),
+        # SummaryTab.update_chart
+        'summary_chart[30d,day]': (lambda: draw_summary_chart(summaries[30, 'day']), None),
+        'summary_chart[365d,week]': (lambda: draw_summary_chart(summaries[365, 'week']), None),
+        'summary_chart[365d,day]': (lambda: draw_summary_chart(summaries[365, 'day']), None),
+    }
+    return {name: measure(fn, repeat, setup) for name, (fn, setup) in benchmarks.items()}
+
+
+def archive_benchmarks(data_manager, repeat, end):
+    """Moves a closed year out to its archive file and back; run last, as it reorganises the database."""
+    year = end.year - 2
+
+    def restored():
+        if any(row[0] == year for row in data_manager.get_archives()):
+            data_manager.restore_year(year)
+        return ()
+
+    def archived():
+        restored()
+        data_manager.archive_year(year)
+        return ()
+
+    try:
+        return {
+            'archive_year': measure(lambda: data_manager.archive_year(year), repeat, restored),
+            'restore_year': measure(lambda: data_manager.restore_year(year), repeat, archived),
+        }
+    finally:
+        restored()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def synthetic_database(data_dir, rows, seed):
+    """
+    Returns (path, end) of a database in data_dir generated with `rows` and
+    `seed`, and the last day of its data, or (None, None) if there is none.
+    The end date is part of the file name, so a database generated on an
+    earlier day is still queried over the windows its data covers.
+    """
+    prefix = f'synthetic-{rows}-seed{seed}-'
+    paths = sorted(glob.glob(os.path.join(glob.escape(data_dir), glob.escape(prefix) + '*.db')))
+    if not paths:
+        return None, None
+    path = paths[-1]
+    return path, date.fromisoformat(os.path.basename(path)[len(prefix):-len('.db')])
+
+
+def run(sizes, repeat, seed, data_dir):
+    results = {}
+    for rows in sizes:
+        path, end = synthetic_database(data_dir, rows, seed)
+        size_results = {}
+        if path is None:
+            print(f"Generating {rows:,} rows...", file=sys.stderr)
+            end = date.today()
+            path = os.path.join(data_dir, f'synthetic-{rows}-seed{seed}-{end}.db')
+            count, elapsed = populate(path, rows, seed=seed, end=end)
+            size_results['populate'] = {'rows': count, 'seconds': elapsed, 'rows_per_s': count / max(elapsed, 1e-9)}
+        size_results['data'] = {'end': str(end)}
+        print(f"Benchmarking {rows:,} rows...", file=sys.stderr)
+        # The write benchmarks change the database, so they run on a copy
+        with tempfile.TemporaryDirectory() as tmp:
+            scratch = os.path.join(tmp, 'bench.db')
+            shutil.copyfile(path, scratch)
+            data_manager = DataManager(scratch)
+            try:
+                size_results.update(data_manager_benchmarks(data_manager, repeat, end))
+                size_results.update(chart_benchmarks(data_manager, repeat, end))
+                size_results.update(archive_benchmarks(data_manager, repeat, end))
+            finally:
+                data_manager.close()
+        results[str(rows)] = size_results
+    return results
+
+
+def compare(results, baseline, threshold, min_ms):
+    """
+    Prints each timing against the baseline; returns the names that got
+    slower by more than `threshold` times and more than min_ms.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, timing in benchmarks.items():
+            before = baseline.get(size, {}).get(name)
+            if 'min_ms' not in timing or not before:
+                continue
+            ratio = timing['min_ms'] / max(before['min_ms'], 1e-6)
+            flag = ''
+            if ratio > threshold and timing['min_ms'] - before['min_ms'] > min_ms:
+                flag = '  REGRESSION'
+                regressions.append(f"{size}/{name}")
+            print(f"{size:>9} {name:45} {before['min_ms']:10.2f} -> {timing['min_ms']:10.2f} ms "
+                  f"({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help="Keep generated databases here and reuse them on later runs")
+    parser.add_argument('--output', help="JSON file to write (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown ratio counted as a regression")
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help="Ignore slowdowns smaller than this, which are mostly noise")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        results = run(args.sizes, args.repeat, args.seed, args.data_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run(args.sizes, args.repeat, args.seed, tmp)
+
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_ms)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            return 1
+    else:
+        for size, benchmarks in results.items():
+            for name, timing in benchmarks.items():
+                if 'min_ms' in timing:
+                    print(f"{size:>9} {name:45} {timing['min_ms']:10.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
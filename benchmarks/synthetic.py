@@ -0,0 +1,90 @@
+"""
+Seeded synthetic workloads: years of activities across many categories.
+
+    python -m benchmarks.synthetic time_records_bench.db --rows 1000000 --years 5
+
+The same seed and arguments always produce the same rows, so timings taken
+on different commits compare like with like.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from data.data_manager import DataManager
+
+
+def generate(rows, years=5, categories=40, activities=400, seed=0, end=None):
+    """
+    Yields `rows` (date, activity, duration, category) records, the format of
+    DataManager.add_activities_bulk, in date order over `years` ending at `end`
+    (today by default). Weekdays get more entries than weekends, a few
+    categories and activities take most of the time, and every activity
+    belongs to one category, as in real logs.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    days = max(1, years * 365)
+    first = end - timedelta(days=days - 1)
+
+    category_names = [f"category {i}" for i in range(categories)]
+    activity_names = [f"activity {i}" for i in range(activities)]
+    activity_category = [category_names[rng.randrange(categories)] for _ in range(activities)]
+    # Zipf-like popularity: the i-th activity is picked about 1/(i+1) as often as the first
+    weights = [1 / (i + 1) for i in range(activities)]
+    cum_weights = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+
+    day_weights = [1.0 if (first + timedelta(days=i)).weekday() < 5 else 0.4 for i in range(days)]
+    scale = rows / sum(day_weights)
+    produced = 0
+    carry = 0.0
+    for i in range(days):
+        # Spread rows over days by weight, carrying the fractions so the total is exact
+        carry += day_weights[i] * scale
+        count = int(carry) if i < days - 1 else rows - produced
+        carry -= count
+        produced += count
+        day = (first + timedelta(days=i)).isoformat()
+        for index in rng.choices(range(activities), cum_weights=cum_weights, k=count):
+            yield (day, activity_names[index], round(rng.lognormvariate(-0.5, 0.7), 2), activity_category[index])
+
+
+def populate(path, rows, years=5, categories=40, activities=400, seed=0, end=None, chunk_size=50000):
+    """
+    Creates a database at path filled with generate(...) rows and the
+    category list. Returns (rows, seconds) of the load.
+    """
+    data_manager = DataManager(path)
+    try:
+        start = time.perf_counter()
+        records = ((day, activity, duration, category, None)
+                   for day, activity, duration, category
+                   in generate(rows, years, categories, activities, seed, end))
+        count = data_manager.import_activities(records, chunk_size=chunk_size)
+        for i in range(categories):
+            data_manager.add_category(f"category {i}")
+        return count, time.perf_counter() - start
+    finally:
+        data_manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help="Database file to create")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--activities', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    count, elapsed = populate(args.path, args.rows, args.years, args.categories, args.activities, args.seed)
+    print(f"Wrote {count:,} rows to {args.path} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import logging
+import sys
+import time
+from data.connection import DEFAULT_DB_PATH
+from data.data_manager import DataManager
+from data.transfer import FORMATS, read_records, write_records
+
+
+def rebuild_rollup(data_manager, args):
+    data_manager.rebuild_daily_totals()
+    print("Rebuilt daily_category_totals")
+    return 0
+
+
+def check_rollup(data_manager, args):
+    mismatches = data_manager.check_daily_totals()
+    for record_date, category, expected, actual in mismatches:
+        print(f"{record_date} {category!r}: activities={expected} rollup={actual}")
+    print(f"{len(mismatches)} mismatched rows")
+    return 1 if mismatches else 0
+
+
+def import_file(data_manager, args):
+    start = time.perf_counter()
+    count = data_manager.import_activities(read_records(args.path, args.format), chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+
+def export_file(data_manager, args):
+    start = time.perf_counter()
+    batches = data_manager.export_activities(args.start, args.end, batch_size=args.chunk_size)
+    count = write_records(args.path, batches, args.format)
+    elapsed = time.perf_counter() - start
+    print(f"Exported {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+
+def report(data_manager, args):
+    # Reports import nothing from Tk; matplotlib is only loaded for PNG output
+    from ui.report import ReportRenderer, build_report, write_csv, write_json
+
+    output = args.output or ('report-{range}.png' if args.format == 'png' else '-')
+    if output == '-' and args.format == 'png':
+        raise ValueError("PNG reports need an --output file")
+    if len(args.range) > 1 and output != '-' and '{range}' not in output:
+        raise ValueError("--output needs a {range} placeholder when several ranges are given")
+    renderer = ReportRenderer() if args.format == 'png' else None
+    write = write_json if args.format == 'json' else write_csv
+    for range_text in args.range:
+        result = build_report(data_manager, range_text, args.granularity)
+        if output == '-':
+            write(result, sys.stdout)
+            continue
+        path = output.replace('{range}', range_text.replace(':', '_'))
+        if renderer is not None:
+            renderer.render(result, path)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                write(result, f)
+        print(f"Wrote {path}", file=sys.stderr)
+    return 0
+
+
+def archive(data_manager, args):
+    for year in args.years:
+        start = time.perf_counter()
+        count = data_manager.archive_year(year, read_only=args.read_only_files)
+        print(f"Archived {count} rows of {year} in {time.perf_counter() - start:.1f}s")
+    if args.years and args.compact:
+        data_manager.vacuum()
+        print("Compacted the main database")
+    for year, path, rows, read_only in data_manager.get_archives():
+        print(f"{year}: {rows} rows in {path}{' (read-only)' if read_only else ''}")
+    return 0
+
+
+def unarchive(data_manager, args):
+    for year in args.years:
+        count = data_manager.restore_year(year)
+        print(f"Restored {count} rows of {year}")
+    return 0
+
+
+def serve(data_manager, args):
+    # Only this command needs the server, and with it asyncio
+    from apis.http_server import DEFAULT_HOST, DEFAULT_PORT, HTTPServer
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    host = args.host or DEFAULT_HOST
+    port = DEFAULT_PORT if args.port is None else args.port
+    try:
+        HTTPServer(data_manager, host, port).run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time tracker command line: maintenance, import/export, reports and the HTTP API")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("rebuild-rollup", help="Recompute the daily category totals").set_defaults(func=rebuild_rollup)
+    commands.add_parser("check-rollup", help="Verify the daily category totals").set_defaults(func=check_rollup)
+
+    import_parser = commands.add_parser("import", help="Load activities from a CSV, JSONL or Parquet file")
+    import_parser.add_argument("path")
+    import_parser.set_defaults(func=import_file)
+    export_parser = commands.add_parser("export", help="Write activities to a CSV, JSONL or Parquet file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--from", dest="start", help="First date to export (YYYY-MM-DD)")
+    export_parser.add_argument("--to", dest="end", help="Last date to export (YYYY-MM-DD)")
+    export_parser.set_defaults(func=export_file)
+    for transfer_parser in (import_parser, export_parser):
+        transfer_parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+        transfer_parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per batch")
+
+    report_parser = commands.add_parser("report", help="Render a summary as PNG, JSON or CSV without the GUI")
+    report_parser.add_argument("--range", action="append",
+                               help="30d, 12w, 6m, 1y or YYYY-MM-DD:YYYY-MM-DD; repeat for several reports "
+                                    "(default 30d)")
+    report_parser.add_argument("--format", choices=("png", "json", "csv"), default="png")
+    report_parser.add_argument("--granularity", choices=("day", "week", "month"),
+                               help="Bucket size; picked from the range length by default")
+    report_parser.add_argument("--output", help="File to write, '-' for stdout; {range} is replaced by the range")
+    # Reports only read, and a missing database is an error rather than a new empty one
+    report_parser.set_defaults(func=report, read_only=True)
+
+    archive_parser = commands.add_parser("archive", help="Move closed years into per-year database files; "
+                                                         "lists the archives without YEARs")
+    archive_parser.add_argument("years", nargs="*", type=int, metavar="YEAR")
+    # Not dest=read_only, which main() takes as opening the database read-only
+    archive_parser.add_argument("--read-only", dest="read_only_files", action="store_true",
+                                help="Make the archive files read-only")
+    archive_parser.add_argument("--compact", action="store_true",
+                                help="VACUUM the main database afterwards to shrink the file")
+    archive_parser.set_defaults(func=archive)
+    unarchive_parser = commands.add_parser("unarchive", help="Move archived years back into the main database")
+    unarchive_parser.add_argument("years", nargs="+", type=int, metavar="YEAR")
+    unarchive_parser.set_defaults(func=unarchive)
+
+    serve_parser = commands.add_parser("serve", help="Serve the data read-only as a local HTTP/JSON API")
+    serve_parser.add_argument("--host", help="Address to listen on (default: loopback only)")
+    serve_parser.add_argument("--port", type=int, help="Port to listen on (default 8765)")
+    serve_parser.set_defaults(func=serve, read_only=True)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "report" and not args.range:
+        args.range = ["30d"]
+    try:
+        data_manager = DataManager(args.db, read_only=getattr(args, "read_only", False))
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    try:
+        return args.func(data_manager, args)
+    except (ValueError, ImportError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        data_manager.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+KPIs over a window of days ending today: hours per category group, rolling
+averages, streaks and the productivity ratio.
+
+The window is read once from the daily rollup into a NumPy structured
+array and reduced to a (days, groups) matrix, so every KPI is a handful of
+array operations. Records added through record() update the matrix in
+place instead of re-querying.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from data.data_manager import CATEGORY_GROUPS
+
+# One row per (day, category) of the rollup; day counts from the window start
+DAILY_DTYPE = np.dtype([('day', 'i4'), ('category', 'i4'), ('hours', 'f8')])
+# Column of all tracked time, after the CATEGORY_GROUPS columns
+TRACKED = len(CATEGORY_GROUPS)
+
+class Analytics:
+    def __init__(self, data_manager, days=365):
+        self.data_manager = data_manager
+        self.days = days
+        self.version = None
+        self.end = None
+
+    def load(self, today=None):
+        # Read before querying so a write racing the load triggers another one
+        self.version = self.data_manager.data_version()
+        self.end = today or date.today()
+        self.start = self.end - timedelta(days=self.days - 1)
+        rows = self.data_manager.get_daily_totals(self.start, self.end)
+        groups = self.data_manager.get_category_groups()
+
+        self.categories = sorted({category for _, category, _ in rows} | set(groups))
+        self.category_index = {category: i for i, category in enumerate(self.categories)}
+        # Group column of each category, TRACKED when it is in no group
+        self.group_codes = np.array([CATEGORY_GROUPS.index(groups[category]) if category in groups else TRACKED
+                                     for category in self.categories], dtype='i4')
+        # With no category marked productive, all tracked time counts as productive
+        self.productive_is_tracked = 'productive' not in groups.values()
+
+        self.records = np.zeros(len(rows), dtype=DAILY_DTYPE)
+        if rows:
+            dates, categories, hours = zip(*rows)
+            start = np.datetime64(self.start, 'D')
+            self.records['day'] = (np.array(dates, dtype='datetime64[D]') - start).astype('i4')
+            self.records['category'] = [self.category_index[category] for category in categories]
+            self.records['hours'] = hours
+        self._reduce()
+
+    def _reduce(self):
+        """Rebuilds self.hours: (days, groups + 1) with tracked time in the last column."""
+        records = self.records
+        columns = TRACKED + 1
+        grouped = np.bincount(records['day'] * columns + self.group_codes[records['category']],
+                              weights=records['hours'], minlength=self.days * columns)
+        self.hours = grouped.reshape(self.days, columns)
+        # Grouped time lives in its group column; the last column sums everything
+        self.hours[:, TRACKED] = self.hours.sum(axis=1)
+
+    def is_current(self):
+        return self.end == date.today() and self.version == self.data_manager.data_version()
+
+    def refresh(self):
+        """Reloads if the data changed or the day rolled over since the last load."""
+        if not self.is_current():
+            self.load()
+
+    def record(self, record_date, category, hours, version_before):
+        """
+        Applies a record just added through the DataManager, given its
+        data_version() from before the write. Falls back to a reload if
+        anything else changed the data in between.
+        """
+        record_date = date.fromisoformat(str(record_date))
+        if (self.version != version_before or self.data_manager.data_version() != version_before + 1
+                or not self.start <= record_date <= self.end):
+            self.load()
+            return
+        index = self.category_index.get(category)
+        if index is None:
+            index = self.category_index[category] = len(self.categories)
+            self.categories.append(category)
+            self.group_codes = np.append(self.group_codes, np.int32(TRACKED))
+        day = (record_date - self.start).days
+        self.records = np.append(self.records, np.array([(day, index, hours)], dtype=DAILY_DTYPE))
+        code = self.group_codes[index]
+        if code != TRACKED:
+            self.hours[day, code] += hours
+        self.hours[day, TRACKED] += hours
+        self.version = version_before + 1
+
+    def series(self, group):
+        """Hours per day of the window for a group name, or 'tracked' for all time."""
+        if group == 'tracked' or (group == 'productive' and self.productive_is_tracked):
+            return self.hours[:, TRACKED]
+        return self.hours[:, CATEGORY_GROUPS.index(group)]
+
+    def rolling_average(self, group, window):
+        """Mean hours per day over each trailing `window` days; one value per day of the window."""
+        cumulative = np.concatenate(([0.0], np.cumsum(self.series(group))))
+        counts = np.minimum(np.arange(1, self.days + 1), window)
+        return (cumulative[1:] - cumulative[np.maximum(np.arange(1, self.days + 1) - window, 0)]) / counts
+
+    def streaks(self, group, min_hours=0.0):
+        """
+        Returns (current, longest) runs of consecutive days with more than
+        min_hours. Today only ends the current streak once it is over, so a
+        streak that reached yesterday still counts.
+        """
+        active = (self.series(group) > min_hours).astype(np.int8)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], active, [0]))))
+        starts, ends = edges[::2], edges[1::2]
+        if not len(starts):
+            return 0, 0
+        lengths = ends - starts
+        current = int(lengths[-1]) if ends[-1] >= self.days - 1 else 0
+        return current, int(lengths.max())
+
+    def today(self):
+        """Today's KPIs: hours per group and tracked, and productive time over the hours elapsed."""
+        kpis = {group: float(self.series(group)[-1]) for group in CATEGORY_GROUPS + ('tracked',)}
+        now = datetime.now()
+        elapsed = now.hour + now.minute / 60
+        kpis['ratio'] = kpis['productive'] / elapsed if elapsed else 0.0
+        return kpis
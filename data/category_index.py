@@ -0,0 +1,71 @@
+import bisect
+import difflib
+import threading
+
+class CategoryIndex:
+    """
+    In-memory index of category names for search-as-you-type.
+
+    Names are kept sorted by their lowercase form, so prefix matches are a
+    binary search. Substring matches scan the (small) list in memory, and
+    near misses are ranked with difflib so typos still find something.
+    """
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self._keys = []  # lowercase names, sorted
+        self._names = []  # original names, in the same order
+        for name in sorted(set(names), key=str.lower):
+            self._keys.append(name.lower())
+            self._names.append(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        key = name.lower()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                if self._names[i] == name:
+                    return
+                i += 1
+            self._keys.insert(i, key)
+            self._names.insert(i, name)
+
+    def search(self, term, limit=None, fuzzy_cutoff=0.6):
+        """
+        Returns names matching term (case-insensitive): prefix matches first,
+        then other substring matches by where the term occurs, then fuzzy
+        matches by similarity. An empty term returns every name.
+        """
+        term = term.lower()
+        with self._lock:
+            keys, names = self._keys, list(self._names)
+            if not term:
+                return names[:limit]
+
+            start = bisect.bisect_left(keys, term)
+            end = start
+            while end < len(keys) and keys[end].startswith(term):
+                end += 1
+            prefix = list(range(start, end))
+            prefix.sort(key=lambda i: len(keys[i]))
+
+            substring = [i for i in range(len(keys)) if not start <= i < end and term in keys[i]]
+            substring.sort(key=lambda i: (keys[i].find(term), len(keys[i])))
+            ranked = prefix + substring
+            if limit is not None and len(ranked) >= limit:
+                return [names[i] for i in ranked[:limit]]
+
+            matched = set(ranked)
+            fuzzy = []
+            for i, key in enumerate(keys):
+                if i in matched:
+                    continue
+                # Compare against the start of the name so long names are not penalised
+                score = difflib.SequenceMatcher(None, term, key[:len(term) + 2]).ratio()
+                if score >= fuzzy_cutoff:
+                    fuzzy.append((-score, i))
+            fuzzy.sort()
+            ranked += [i for _, i in fuzzy]
+        return [names[i] for i in ranked[:limit]]
@@ -0,0 +1,115 @@
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from instrumentation import InstrumentedConnection
+
+# Keep the database next to the code rather than in whatever directory the
+# app happened to be launched from.
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'time_records.db')
+
+class ConnectionManager:
+    """
+    Owns a small pool of SQLite connections to one database file.
+
+    Connections run in WAL mode so readers never wait on a writer, and may be
+    checked out from any thread. A thread that already holds a connection gets
+    the same one back, so nested DataManager calls share a transaction.
+    With `instrument`, pooled connections time every statement into
+    instrumentation.METRICS. With `read_only`, connections are opened in
+    SQLite's read-only mode: writes fail, and a missing database file is an
+    error rather than being created.
+    """
+    def __init__(self, db_path=DEFAULT_DB_PATH, pool_size=4, cache_size_kib=16384,
+                 mmap_size=64 * 1024 * 1024, cached_statements=256, timeout=10.0, instrument=True,
+                 read_only=False):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self.instrument = instrument
+        self.read_only = read_only
+
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._watcher = None
+
+    def _connect(self, factory=sqlite3.Connection):
+        if self.read_only:
+            conn = sqlite3.connect(pathlib.Path(self.db_path).absolute().as_uri() + '?mode=ro', uri=True,
+                                   timeout=self.timeout, check_same_thread=False,
+                                   cached_statements=self.cached_statements, factory=factory)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                                   cached_statements=self.cached_statements, factory=factory)
+            # Persistent in the file; read-only connections follow whatever the writers set
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # PRAGMA does not accept bound parameters; a negative cache_size is in KiB
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kib)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.pool_size:
+                conn = self._connect(InstrumentedConnection if self.instrument else sqlite3.Connection)
+                self._all.append(conn)
+                return conn
+        # Pool exhausted, wait for another thread to hand one back
+        return self._idle.get(timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection for the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Checks out a connection and commits on success, rolls back on error."""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def data_version(self):
+        """
+        PRAGMA data_version as seen by a connection that never writes, so it
+        changes after every commit made through the pool or by another process.
+        """
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = self._connect()
+            return self._watcher.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
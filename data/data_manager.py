@@ -1,15 +1,418 @@
+import json
+import os
+import pathlib
 import sqlite3
-from datetime import date, timedelta
+import stat
+import threading
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import islice, repeat
+from data.category_index import CategoryIndex
+from data.connection import ConnectionManager, DEFAULT_DB_PATH
+from data.query_cache import ALL_DATES, QueryCache, cached
+from instrumentation import timed
+
+def create_category_fts(conn):
+    """
+    Trigram FTS5 index over category names, kept in sync by triggers. Skipped
+    when this SQLite build lacks FTS5 or the trigram tokenizer; searches then
+    always use the in-memory CategoryIndex.
+    """
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS categories_fts
+            USING fts5(name, content='categories', content_rowid='id', tokenize='trigram')
+        ''')
+    except sqlite3.OperationalError:
+        return
+    conn.execute("INSERT INTO categories_fts (categories_fts) VALUES ('rebuild')")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS categories_fts_insert AFTER INSERT ON categories
+        BEGIN
+            INSERT INTO categories_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS categories_fts_delete AFTER DELETE ON categories
+        BEGIN
+            INSERT INTO categories_fts (categories_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS categories_fts_update AFTER UPDATE OF name ON categories
+        BEGIN
+            INSERT INTO categories_fts (categories_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+            INSERT INTO categories_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+
+def normalize_activities(conn):
+    """
+    Replaces the category and activity text repeated in every activities row
+    with integer ids into the categories and activity_names lookup tables.
+    The daily rollup and category groups are rekeyed by category id too.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS activity_names (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO categories (name)
+        SELECT DISTINCT COALESCE(category, '') FROM activities
+        UNION SELECT category FROM category_groups
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO activity_names (name)
+        SELECT DISTINCT COALESCE(activity, '') FROM activities
+    ''')
+
+    conn.execute('''
+        CREATE TABLE activities_normalized (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            activity_name_id INTEGER NOT NULL REFERENCES activity_names (id),
+            duration REAL,
+            source_id INTEGER
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO activities_normalized (id, date, category_id, activity_name_id, duration, source_id)
+        SELECT a.id, a.date, c.id, n.id, a.duration, a.source_id
+        FROM activities a
+        JOIN categories c ON c.name = COALESCE(a.category, '')
+        JOIN activity_names n ON n.name = COALESCE(a.activity, '')
+        ORDER BY a.id
+    ''')
+    # Dropping the table drops its indexes and rollup triggers with it
+    conn.execute('DROP TABLE activities')
+    conn.execute('ALTER TABLE activities_normalized RENAME TO activities')
+    conn.execute('''
+        CREATE INDEX idx_activities_date_category
+        ON activities (date, category_id, activity_name_id, duration)
+    ''')
+    conn.execute('CREATE INDEX idx_activities_date ON activities (date)')
+    conn.execute('CREATE UNIQUE INDEX idx_activities_source_id ON activities (source_id)')
+
+    conn.execute('DROP TABLE daily_category_totals')
+    conn.execute('''
+        CREATE TABLE daily_category_totals (
+            date TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            duration REAL NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (date, category_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO daily_category_totals (date, category_id, duration, entries)
+        SELECT date, category_id, SUM(duration), COUNT(*) FROM activities
+        GROUP BY date, category_id
+    ''')
+    conn.execute('''
+        CREATE TRIGGER activities_totals_insert AFTER INSERT ON activities
+        BEGIN
+            INSERT INTO daily_category_totals (date, category_id, duration, entries)
+            VALUES (NEW.date, NEW.category_id, NEW.duration, 1)
+            ON CONFLICT (date, category_id) DO UPDATE
+            SET duration = duration + excluded.duration, entries = entries + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER activities_totals_delete AFTER DELETE ON activities
+        BEGIN
+            UPDATE daily_category_totals
+            SET duration = duration - OLD.duration, entries = entries - 1
+            WHERE date = OLD.date AND category_id = OLD.category_id;
+            DELETE FROM daily_category_totals
+            WHERE date = OLD.date AND category_id = OLD.category_id AND entries <= 0;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER activities_totals_update
+        AFTER UPDATE OF date, category_id, duration ON activities
+        BEGIN
+            UPDATE daily_category_totals
+            SET duration = duration - OLD.duration, entries = entries - 1
+            WHERE date = OLD.date AND category_id = OLD.category_id;
+            DELETE FROM daily_category_totals
+            WHERE date = OLD.date AND category_id = OLD.category_id AND entries <= 0;
+            INSERT INTO daily_category_totals (date, category_id, duration, entries)
+            VALUES (NEW.date, NEW.category_id, NEW.duration, 1)
+            ON CONFLICT (date, category_id) DO UPDATE
+            SET duration = duration + excluded.duration, entries = entries + 1;
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TABLE category_groups_normalized (
+            category_id INTEGER PRIMARY KEY REFERENCES categories (id),
+            group_name TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO category_groups_normalized (category_id, group_name)
+        SELECT c.id, g.group_name FROM category_groups g JOIN categories c ON c.name = g.category
+    ''')
+    conn.execute('DROP TABLE category_groups')
+    conn.execute('ALTER TABLE category_groups_normalized RENAME TO category_groups')
+
+class _NameLookup(dict):
+    """
+    id -> name of a lookup table, loaded in one query. Names are only ever
+    added, so an id missing from the snapshot is fetched on its own.
+    """
+    def __init__(self, conn, table):
+        self.conn = conn
+        self.table = table
+        super().__init__(conn.execute(f'SELECT id, name FROM {table}'))
+
+    def __missing__(self, key):
+        row = self.conn.execute(f'SELECT name FROM {self.table} WHERE id = ?', (key,)).fetchone()
+        self[key] = name = row[0] if row else None
+        return name
+
+# Schema migrations, applied in order on top of the tables made by
+# create_tables. The database stores how many have been applied in
+# PRAGMA user_version, so each entry upgrades it by exactly one version.
+# An entry is a list of SQL statements, or a function taking the connection
+# for changes that need logic.
+MIGRATIONS = [
+    # 1: covering index for per-date lookups and date-range summaries
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_activities_date_category
+        ON activities (date, category, activity, duration)
+        ''',
+    ],
+    # 2: narrow date index for DISTINCT date listings
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_activities_date ON activities (date)
+        ''',
+    ],
+    # 3: per-day, per-category rollup kept current by triggers, so range
+    # summaries read one row per (date, category) instead of every entry;
+    # uncategorised entries are totalled under ''
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_category_totals (
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            duration REAL NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (date, category)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO daily_category_totals (date, category, duration, entries)
+        SELECT date, COALESCE(category, ''), SUM(duration), COUNT(*) FROM activities
+        GROUP BY date, COALESCE(category, '')
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS activities_totals_insert AFTER INSERT ON activities
+        BEGIN
+            INSERT INTO daily_category_totals (date, category, duration, entries)
+            VALUES (NEW.date, COALESCE(NEW.category, ''), NEW.duration, 1)
+            ON CONFLICT (date, category) DO UPDATE
+            SET duration = duration + excluded.duration, entries = entries + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS activities_totals_delete AFTER DELETE ON activities
+        BEGIN
+            UPDATE daily_category_totals
+            SET duration = duration - OLD.duration, entries = entries - 1
+            WHERE date = OLD.date AND category = COALESCE(OLD.category, '');
+            DELETE FROM daily_category_totals
+            WHERE date = OLD.date AND category = COALESCE(OLD.category, '') AND entries <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS activities_totals_update
+        AFTER UPDATE OF date, category, duration ON activities
+        BEGIN
+            UPDATE daily_category_totals
+            SET duration = duration - OLD.duration, entries = entries - 1
+            WHERE date = OLD.date AND category = COALESCE(OLD.category, '');
+            DELETE FROM daily_category_totals
+            WHERE date = OLD.date AND category = COALESCE(OLD.category, '') AND entries <= 0;
+            INSERT INTO daily_category_totals (date, category, duration, entries)
+            VALUES (NEW.date, COALESCE(NEW.category, ''), NEW.duration, 1)
+            ON CONFLICT (date, category) DO UPDATE
+            SET duration = duration + excluded.duration, entries = entries + 1;
+        END
+        ''',
+    ],
+    # 4: full-text index for searching very large category sets
+    create_category_fts,
+    # 5: id of the record in the system it was imported from (Garmin
+    # activityId), unique so re-imports can upsert
+    [
+        '''
+        ALTER TABLE activities ADD COLUMN source_id INTEGER
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_activities_source_id ON activities (source_id)
+        ''',
+    ],
+    # 6: which KPI group (see CATEGORY_GROUPS) each category counts towards
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS category_groups (
+            category TEXT PRIMARY KEY,
+            group_name TEXT NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 7: integer category and activity keys instead of repeated names
+    normalize_activities,
+    # 8: closed years moved out to their own database files by archive_year;
+    # path is relative to the main database's directory, max_id the highest
+    # activity id in the file
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS archives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+        ''',
+    ],
+    # 9: full Garmin detail of an activity, keyed by its activityId
+    # (activities.source_id) and fetched on demand. payload is the
+    # zlib-compressed JSON, kept last so reads of the numeric columns stop
+    # short of it. Aggregates reach rows through the primary key from
+    # activities, so the metrics have no index of their own.
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS activity_details (
+            source_id INTEGER PRIMARY KEY,
+            fetched_at TEXT NOT NULL,
+            average_hr REAL,
+            max_hr REAL,
+            distance_km REAL,
+            calories REAL,
+            payload BLOB NOT NULL
+        )
+        ''',
+    ],
+    # 10: drops the metrics index early builds of migration 9 created; no
+    # query read it, and every details write paid to keep it up to date
+    [
+        '''
+        DROP INDEX IF EXISTS idx_activity_details_metrics
+        ''',
+    ],
+]
+
+# Columns of the activities table and the daily rollup, which archive
+# databases repeat so queries can UNION ALL them with the main database
+ACTIVITY_COLUMNS = 'id, date, category_id, activity_name_id, duration, source_id'
+TOTALS_COLUMNS = 'date, category_id, duration, entries'
+
+# SQLite's default limit on the databases attached to one connection, and so
+# on the archived years a single query can span
+MAX_ATTACHED = 10
+
+# KPI groups a category can be assigned to
+CATEGORY_GROUPS = ('productive', 'exercise', 'improvement')
+
+# Category and activity names are stored as ids into the lookup tables; the
+# writes below resolve them, so the names must have been interned first.
+
+# A None id lets SQLite assign one; see DataManager._new_ids.
+
+# Parameters: (id, date, category, activity, duration)
+INSERT_ACTIVITY = '''
+    INSERT INTO activities (id, date, category_id, activity_name_id, duration)
+    VALUES (?, ?, (SELECT id FROM categories WHERE name = ?), (SELECT id FROM activity_names WHERE name = ?), ?)
+'''
+
+# Insert a record, or update the one imported earlier under the same source_id.
+# Parameters: (id, source_id, date, category, activity, duration)
+UPSERT_ACTIVITY = '''
+    INSERT INTO activities (id, source_id, date, category_id, activity_name_id, duration)
+    VALUES (?, ?, ?, (SELECT id FROM categories WHERE name = ?), (SELECT id FROM activity_names WHERE name = ?), ?)
+    ON CONFLICT (source_id) DO UPDATE SET date=excluded.date, duration=excluded.duration
+'''
+
+# SQL expressions that map a date to the label of the period containing it.
+# Weeks start on Monday and are labelled by that Monday's date.
+GRANULARITIES = {
+    'day': "date",
+    'week': "date(date, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m', date)",
+}
+
+# Row of activity_details, with payload decompressed and parsed
+ActivityDetails = namedtuple('ActivityDetails', ['source_id', 'fetched_at', 'average_hr', 'max_hr',
+                                                 'distance_km', 'calories', 'payload'])
+
+# periods: List[str] labels, categories: List[str],
+# values: np.ndarray of hours shaped (len(periods), len(categories))
+Summary = namedtuple('Summary', ['periods', 'categories', 'values'])
+
+def period_labels(start, end, granularity):
+    """Returns the labels of every period between start and end, inclusive."""
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+    elif granularity == 'month':
+        return [f"{year:04d}-{month:02d}"
+                for year in range(start.year, end.year + 1)
+                for month in range(1, 13)
+                if (start.year, start.month) <= (year, month) <= (end.year, end.month)]
+    step = timedelta(days=7 if granularity == 'week' else 1)
+    labels = []
+    while start <= end:
+        labels.append(start.isoformat())
+        start += step
+    return labels
 
 class DataManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('time_records.db')
-        self.create_tables()
+    # Above this many categories, searches go to the FTS5 table (when the
+    # database has one) instead of holding every name in memory
+    CATEGORY_FTS_THRESHOLD = 10000
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, connections=None, cache_size=256, read_only=False):
+        self.connections = connections if connections else ConnectionManager(db_path, read_only=read_only)
+        self.cache = QueryCache(cache_size)
+        # Built on first search; None until then
+        self._category_index = None
+        self._category_fts = None
+        self._version = 0
+        self._seen_data_version = None
+        self._version_lock = threading.Lock()
+        # {year: (path, rows, max_id)} from the archives table; None until read
+        self._archive_list = None
+        # Bumped whenever archives are added or removed; id(conn) -> the
+        # generation its attached archives were attached at
+        self._archive_generation = 0
+        self._attached = {}
+        if read_only:
+            # A reader can't create or upgrade the schema; a writer has to have done it
+            try:
+                version = self.schema_version()
+            except sqlite3.OperationalError as e:
+                self.close()
+                raise ValueError(f"Cannot open {db_path} read-only: {e}") from None
+            if version != len(MIGRATIONS):
+                self.close()
+                raise ValueError(f"{db_path} is at schema version {version}, expected {len(MIGRATIONS)}; "
+                                 "open it read-write once to upgrade it")
+        else:
+            self.create_tables()
+            self.migrate()
 
     def create_tables(self):
-        with self.conn:
+        with self.connections.transaction() as conn:
             # Create activities table
-            self.conn.execute('''
+            conn.execute('''
                 CREATE TABLE IF NOT EXISTS activities (
                     id INTEGER PRIMARY KEY,
                     date TEXT,
@@ -20,124 +423,1017 @@ class DataManager:
             ''')
 
             # Create categories table
-            self.conn.execute('''
+            conn.execute('''
                 CREATE TABLE IF NOT EXISTS categories (
                     id INTEGER PRIMARY KEY,
                     name TEXT UNIQUE
                 )
             ''')
 
+    @contextmanager
+    def _write(self, dates=None, tags=None):
+        """
+        Transaction for a write. Once it commits, bumps the data version and
+        evicts the cached results it may have changed: those covering `dates`,
+        those carrying any of `tags`, or everything when neither is given.
+        Both are read after the commit, so a write can fill them in as it goes.
+        """
+        self._check_external_writes()
+        with self.connections.transaction() as conn:
+            yield conn
+        if dates is None and tags is None:
+            self.cache.clear()
+        else:
+            for tag in tags or ():
+                self.cache.invalidate_tag(tag)
+            if dates is not None:
+                self.cache.invalidate_dates(str(d) for d in dates)
+        with self._version_lock:
+            self._version += 1
+            # Our own commit moves PRAGMA data_version as well; absorb it so it
+            # isn't taken for another process's write. Only a foreign commit
+            # landing during this write can slip through unnoticed.
+            self._seen_data_version = self.connections.data_version()
+
+    def _check_external_writes(self):
+        """Bumps the version and drops the cache if another process wrote to the database."""
+        with self._version_lock:
+            seen = self.connections.data_version()
+            if seen != self._seen_data_version:
+                if self._seen_data_version is not None:
+                    self.cache.clear()
+                    self._category_index = None
+                    self._category_fts = None
+                    self._reset_archives()
+                self._seen_data_version = seen
+                self._version += 1
+
+    def data_version(self):
+        """
+        Monotonically increasing number that changes whenever the data does,
+        including writes made by other processes. Callers can compare it with
+        the value they last rendered to skip redundant queries.
+        """
+        self._check_external_writes()
+        return self._version
+
+    def cache_stats(self):
+        """Hit/miss counters and size of the query-result cache."""
+        return self.cache.stats()
+
+    def schema_version(self):
+        with self.connections.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    @timed()
+    def migrate(self):
+        """Applies any migrations newer than the database's user_version."""
+        for version in range(self.schema_version(), len(MIGRATIONS)):
+            with self._write() as conn:
+                # Takes the write lock before reading the version again, as
+                # another process opening the same database may have applied
+                # this migration since schema_version() was read
+                conn.execute('BEGIN IMMEDIATE')
+                if conn.execute('PRAGMA user_version').fetchone()[0] > version:
+                    continue
+                migration = MIGRATIONS[version]
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in migration:
+                        conn.execute(statement)
+                # PRAGMA does not accept bound parameters
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+
+    @staticmethod
+    def _intern(conn, tags, categories, activities=()):
+        """
+        Adds the names missing from the categories and activity_names lookup
+        tables. Returns the new category names, and adds the 'categories'
+        cache tag to `tags` if there are any.
+        """
+        activities = set(activities)
+        if activities:
+            conn.executemany('''
+                INSERT OR IGNORE INTO activity_names (name) VALUES (?)
+            ''', ((name,) for name in activities))
+        new = set(categories)
+        names = list(new)
+        # Looked up in batches to stay under SQLite's bound-parameter limit
+        for i in range(0, len(names), 500):
+            batch = names[i:i + 500]
+            new.difference_update(row[0] for row in conn.execute(f'''
+                SELECT name FROM categories WHERE name IN ({', '.join('?' * len(batch))})
+            ''', batch))
+        if new:
+            conn.executemany('''
+                INSERT INTO categories (name) VALUES (?)
+            ''', ((name,) for name in new))
+            tags.add('categories')
+        return new
+
+    def _new_ids(self, conn, count):
+        """
+        Ids for `count` new activities: None, for SQLite to assign, unless
+        archiving moved out the rows with the highest ids. New ids then start
+        after the highest archived one, so none repeats an id in an archive.
+        """
+        floor = max((max_id for path, rows, max_id in self._archives().values()), default=0)
+        if floor and conn.execute('SELECT IFNULL(MAX(id), 0) FROM activities').fetchone()[0] < floor:
+            return range(floor + 1, floor + 1 + count)
+        return repeat(None, count)
+
+    def _index_categories(self, names):
+        """Adds category names created by a committed write to the search index."""
+        index = self._category_index
+        if index is not None:
+            for name in names:
+                if name:
+                    index.add(name)
+
+    @timed()
     def add_today_activity(self, category, activity, duration):
         today = str(date.today())
         self.add_activity(today, activity, duration, category)
 
+    @timed()
     def add_activity(self, selected_date, activity, duration, category=None):
-        with self.conn:
-            self.conn.execute('''
-                INSERT INTO activities (date, category, activity, duration) VALUES (?, ?, ?, ?)
-            ''', (selected_date, category if category else "", activity, duration))
+        category = category if category else ""
+        tags = set()
+        with self._write(dates=[selected_date], tags=tags) as conn:
+            new_categories = self._intern(conn, tags, [category], [activity])
+            new_id, = self._new_ids(conn, 1)
+            conn.execute(INSERT_ACTIVITY, (new_id, selected_date, category, activity, duration))
+        self._index_categories(new_categories)
+
+    @timed()
+    def add_activities_bulk(self, records):
+        """
+        Inserts many records in a single transaction.
+        records: Iterable[Tuple(date, activity, duration, category)]
+        Returns the number of rows inserted.
+        """
+        rows = [(selected_date, category if category else "", activity, duration)
+                for selected_date, activity, duration, category in records]
+        tags = set()
+        with self._write(dates={row[0] for row in rows}, tags=tags) as conn:
+            new_categories = self._intern(conn, tags, (row[1] for row in rows), (row[2] for row in rows))
+            count = conn.executemany(INSERT_ACTIVITY, (
+                (new_id,) + row for new_id, row in zip(self._new_ids(conn, len(rows)), rows))).rowcount
+        self._index_categories(new_categories)
+        return count
+
+    @timed()
+    def upsert_activities(self, records):
+        """
+        Inserts imported records, or updates the date and duration of ones
+        already stored under the same source_id. Category and activity are
+        left alone on update so local edits survive a re-sync. Records already
+        moved to an archive by archive_year are skipped.
+        records: Iterable[Tuple(source_id, date, activity, duration, category)]
+        Returns the number of rows inserted or updated.
+        """
+        rows = [(source_id, selected_date, category if category else "", activity, duration)
+                for source_id, selected_date, activity, duration, category in records]
+        if rows and self._archives():
+            archived = self._archived_source_ids(rows)
+            rows = [row for row in rows if row[0] not in archived]
+        if not rows:
+            return 0
+        dates = {row[1] for row in rows}  # filled in with the old dates of moved rows
+        tags = set()
+        with self._write(dates=dates, tags=tags) as conn:
+            source_ids = [row[0] for row in rows]
+            # Looked up in batches to stay under SQLite's bound-parameter limit
+            for i in range(0, len(source_ids), 500):
+                batch = source_ids[i:i + 500]
+                dates.update(row[0] for row in conn.execute(f'''
+                    SELECT date FROM activities WHERE source_id IN ({', '.join('?' * len(batch))})
+                ''', batch))
+            new_categories = self._intern(conn, tags, (row[2] for row in rows), (row[3] for row in rows))
+            count = conn.executemany(UPSERT_ACTIVITY, (
+                (new_id,) + row for new_id, row in zip(self._new_ids(conn, len(rows)), rows))).rowcount
+        self._index_categories(new_categories)
+        return count
 
+    @timed()
+    def import_activities(self, records, chunk_size=10000, atomic=True):
+        """
+        Streams records in with executemany, chunk_size rows at a time.
+        Records with a source_id upsert like upsert_activities.
+        With `atomic`, all chunks go in one transaction so a bad record part
+        way through leaves nothing behind. Otherwise each chunk commits on its
+        own, so other writers get the database between chunks rather than
+        timing out on the lock for the whole import; a bad record then stops
+        the import with every record before it written.
+        records: Iterable[Tuple(date, activity, duration, category, source_id)]
+        Returns the number of rows written.
+        """
+        records = iter(records)
+        count = 0
+        # Bulk loads can touch any date, so the whole cache is dropped afterwards
+        if atomic:
+            new_categories = set()
+            with self._write() as conn:
+                while True:
+                    chunk = list(islice(records, chunk_size))
+                    if not chunk:
+                        break
+                    count += self._import_chunk(conn, chunk, new_categories)
+            self._index_categories(new_categories)
+        else:
+            error = None
+            while error is None:
+                chunk = []
+                try:
+                    chunk.extend(islice(records, chunk_size))
+                except Exception as e:
+                    error = e
+                if not chunk:
+                    break
+                new_categories = set()
+                with self._write() as conn:
+                    count += self._import_chunk(conn, chunk, new_categories)
+                # Indexed as each chunk commits, so however the import stops
+                # the search index holds the categories written
+                self._index_categories(new_categories)
+            if error is not None:
+                raise error
+        return count
+
+    def _import_chunk(self, conn, records, new_categories):
+        """Writes one chunk of import_activities records; returns its row count."""
+        chunk = [(source_id, selected_date, category if category else "", activity, duration)
+                 for selected_date, activity, duration, category, source_id in records]
+        new_categories |= self._intern(conn, set(), (row[2] for row in chunk), (row[3] for row in chunk))
+        # Date order keeps the index and rollup writes of a chunk on neighbouring pages
+        chunk.sort(key=lambda row: (row[1], row[2]))
+        conn.executemany(UPSERT_ACTIVITY, (
+            (new_id,) + row for new_id, row in zip(self._new_ids(conn, len(chunk)), chunk)))
+        return len(chunk)
+
+    def export_activities(self, start=None, end=None, batch_size=10000):
+        """
+        Yields lists of at most batch_size (date, category, activity, duration,
+        source_id) rows ordered by date, optionally limited to start..end.
+        Each batch is read with its own connection checkout, resuming after
+        the last (date, id) read, so memory use does not grow with the table
+        and no connection is held while the caller handles a batch.
+        Archived years are included.
+        """
+        categories = activities = None
+        # One archived year at a time; SQLite merges the sources, each read in
+        # (date, id) order from its date index
+        for span_start, span_end in self._spans(str(start) if start else ALL_DATES[0],
+                                                str(end) if end else ALL_DATES[1]):
+            after = (span_start, 0)  # ids start at 1
+            while True:
+                with self.connections.connection() as conn:
+                    if categories is None:
+                        # Names are mapped in Python: one dict lookup per row
+                        # beats two primary-key joins over the whole table
+                        categories = _NameLookup(conn, 'categories')
+                        activities = _NameLookup(conn, 'activity_names')
+                    categories.conn = activities.conn = conn
+                    sql, params = self._each_source(self._sources(conn, span_start, span_end), '''
+                        SELECT date, category_id, activity_name_id, duration, source_id, id
+                        FROM {schema}.activities WHERE date BETWEEN ? AND ? AND (date, id) > (?, ?)
+                    ''', (after[0], span_end) + after)
+                    batch = conn.execute(sql + ' ORDER BY date, id LIMIT ?', params + [batch_size]).fetchall()
+                    if not batch:
+                        break
+                    rows = [(day, categories[category_id], activities[activity_id], duration, source_id)
+                            for day, category_id, activity_id, duration, source_id, _ in batch]
+                after = (batch[-1][0], batch[-1][5])
+                yield rows
+                if len(batch) < batch_size:
+                    break
+
+    @timed()
     def edit_activity(self, selected_date, activity, duration):
-        with self.conn:
-            self.conn.execute('''
-                UPDATE activities SET duration=? WHERE date=? AND activity=?
+        with self._write(dates=[selected_date]) as conn:
+            conn.execute('''
+                UPDATE activities SET duration=?
+                WHERE date=? AND activity_name_id=(SELECT id FROM activity_names WHERE name=?)
             ''', (duration, selected_date, activity))
 
+    @timed()
+    def edit_activity_by_id(self, activity_id, activity, duration, category=None):
+        """
+        Updates one row by primary key. Returns False if it no longer exists,
+        and raises ValueError if it has been archived.
+        """
+        category = category if category else ""
+        dates = set()  # filled before commit so the cache evicts the row's date
+        tags = set()
+        new_categories = None
+        with self._write(dates=dates, tags=tags) as conn:
+            row = conn.execute('SELECT date FROM activities WHERE id=?', (activity_id,)).fetchone()
+            if row is not None:
+                dates.add(row[0])
+                new_categories = self._intern(conn, tags, [category], [activity])
+                conn.execute('''
+                    UPDATE activities
+                    SET activity_name_id=(SELECT id FROM activity_names WHERE name=?),
+                        category_id=(SELECT id FROM categories WHERE name=?), duration=?
+                    WHERE id=?
+                ''', (activity, category, duration, activity_id))
+        if new_categories is None:
+            self._check_not_archived(activity_id)
+            return False
+        self._index_categories(new_categories)
+        return True
+
+    @timed()
+    def remove_activity_by_id(self, activity_id):
+        """
+        Deletes one row by primary key. Returns False if it no longer exists,
+        and raises ValueError if it has been archived.
+        """
+        dates = set()
+        with self._write(dates=dates) as conn:
+            row = conn.execute('SELECT date FROM activities WHERE id=?', (activity_id,)).fetchone()
+            if row is not None:
+                dates.add(row[0])
+                conn.execute('DELETE FROM activities WHERE id=?', (activity_id,))
+        if not dates:
+            self._check_not_archived(activity_id)
+            return False
+        return True
+
+    @timed()
     def remove_activity(self, selected_date, activity, duration):
-        with self.conn:
-            self.conn.execute('''
-                DELETE FROM activities WHERE date=? AND activity=? AND duration=?
+        with self._write(dates=[selected_date]) as conn:
+            conn.execute('''
+                DELETE FROM activities
+                WHERE date=? AND activity_name_id=(SELECT id FROM activity_names WHERE name=?) AND duration=?
             ''', (selected_date, activity, duration))
 
     def get_today_activities_grouped_by_category(self):
-        today = str(date.today())
-        cursor = self.conn.execute('''
-            SELECT category, activity, SUM(duration) FROM activities WHERE date=? GROUP BY category, activity
-        ''', (today,))
+        return self.get_activities_grouped_by_category(str(date.today()))
+
+    @timed()
+    @cached(span=lambda selected_date, end=None: (selected_date, end or selected_date))
+    def get_activities_grouped_by_category(self, selected_date, end=None):
+        """
+        Returns {category: [(activity, hours)]} for one date, or for
+        selected_date..end (inclusive) when end is given.
+        """
+        start, end = str(selected_date), str(end or selected_date)
+        with self.connections.connection() as conn:
+            activities = self._union(self._sources(conn, start, end), 'activities',
+                                     'date, category_id, activity_name_id, duration')
+            rows = conn.execute(f'''
+                SELECT c.name, n.name, t.hours FROM (
+                    SELECT category_id, activity_name_id, SUM(duration) AS hours FROM {activities}
+                    WHERE date BETWEEN ? AND ? GROUP BY category_id, activity_name_id
+                ) t
+                JOIN categories c ON c.id = t.category_id
+                JOIN activity_names n ON n.id = t.activity_name_id
+                ORDER BY c.name, n.name
+            ''', (start, end)).fetchall()
         data = {}
-        for category, activity, duration in cursor.fetchall():
+        for category, activity, duration in rows:
             if category not in data:
                 data[category] = []
             data[category].append((activity, duration))
         return data
 
+    @timed()
+    @cached(span=lambda: ALL_DATES)
     def get_dates(self):
-        cursor = self.conn.execute('''
-            SELECT DISTINCT date FROM activities ORDER BY date DESC
-        ''')
-        return [row[0] for row in cursor.fetchall()]
+        dates = []
+        with self.connections.connection() as conn:
+            # Newest span first; spans don't overlap, so their dates don't repeat.
+            # The rollup has a row per date and category rather than per record
+            for start, end in reversed(self._spans(*ALL_DATES)):
+                sql, params = self._each_source(self._sources(conn, start, end), '''
+                    SELECT DISTINCT date FROM {schema}.daily_category_totals WHERE date BETWEEN ? AND ?
+                ''', (start, end), compound='UNION')
+                dates += [row[0] for row in conn.execute(sql + ' ORDER BY date DESC', params)]
+        return dates
 
+    @timed()
+    @cached(span=lambda selected_date: (selected_date, selected_date))
     def get_activities_by_date(self, selected_date):
-        cursor = self.conn.execute('''
-            SELECT activity, category, duration FROM activities WHERE date=?
-        ''', (selected_date,))
-        return cursor.fetchall()
+        """
+        Returns List[Tuple(id, activity, category, duration, source_id)] for
+        one date; source_id is None for records not imported from Garmin.
+        """
+        with self.connections.connection() as conn:
+            activities = self._union(self._sources(conn, selected_date, selected_date), 'activities',
+                                     ACTIVITY_COLUMNS)
+            return conn.execute(f'''
+                SELECT a.id, n.name, c.name, a.duration, a.source_id FROM {activities} a
+                JOIN activity_names n ON n.id = a.activity_name_id
+                JOIN categories c ON c.id = a.category_id
+                WHERE a.date=? ORDER BY a.id
+            ''', (selected_date,)).fetchall()
+
+    @timed()
+    @cached(span=lambda start, end: (start, end))
+    def get_activities_in_range(self, start, end):
+        """Returns List[Tuple(date, activity, category, duration)] for start..end inclusive."""
+        with self.connections.connection() as conn:
+            activities = self._union(self._sources(conn, start, end), 'activities',
+                                     'id, date, category_id, activity_name_id, duration')
+            return conn.execute(f'''
+                SELECT a.date, n.name, c.name, a.duration FROM {activities} a
+                JOIN activity_names n ON n.id = a.activity_name_id
+                JOIN categories c ON c.id = a.category_id
+                WHERE a.date BETWEEN ? AND ? ORDER BY a.date, a.id
+            ''', (str(start), str(end))).fetchall()
+
+    @timed()
+    @cached(span=lambda start, end: (start, end))
+    def get_daily_totals(self, start, end):
+        """Returns List[Tuple(date, category, hours)] from the daily rollup for start..end inclusive."""
+        start, end = str(start), str(end)
+        with self.connections.connection() as conn:
+            sources = self._sources(conn, start, end)
+            if not self._has_unarchived(conn, sources):
+                return conn.execute(*self._each_source(sources, '''
+                    SELECT t.date, c.name, t.duration FROM {schema}.daily_category_totals t
+                    JOIN categories c ON c.id = t.category_id
+                    WHERE t.date BETWEEN ? AND ?
+                ''', (start, end))).fetchall()
+            # Days of an archived year written to since have rows in both the
+            # archive and the main database, which are added up
+            return conn.execute(f'''
+                SELECT t.date, c.name, t.duration FROM (
+                    SELECT date, category_id, SUM(duration) AS duration
+                    FROM {self._union(sources, 'daily_category_totals', TOTALS_COLUMNS)}
+                    WHERE date BETWEEN ? AND ? GROUP BY date, category_id
+                ) t
+                JOIN categories c ON c.id = t.category_id
+            ''', (start, end)).fetchall()
+
+    # Summary Methods
+    @timed()
+    @cached(span=lambda start, end, *args, **kwargs: (start, end))
+    def get_summary(self, start, end, granularity='day', categories=None):
+        """
+        Totals hours per period and category for start..end (inclusive dates).
+        Every period in the range gets a row, even when nothing was logged.
+        Columns follow `categories` when given, otherwise every category with
+        time in the range, sorted by name.
+        Returns Summary(periods, categories, values)
+        """
+        import numpy as np
+
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}")
+        start = date.fromisoformat(str(start))
+        end = date.fromisoformat(str(end))
+        periods = period_labels(start, end, granularity)
+
+        where = ''
+        params = [start.isoformat(), end.isoformat()]
+        if categories is not None:
+            categories = list(categories)
+            where = f" AND category_id IN (SELECT id FROM categories WHERE name IN ({', '.join('?' * len(categories))}))"
+            params += categories
+        # Grouped by id; names are only looked up for the grouped rows. Each
+        # source is grouped on its own, in rollup order, and a period and
+        # category found in more than one is added up below
+        with self.connections.connection() as conn:
+            sql, params = self._each_source(self._sources(conn, start, end), f'''
+                SELECT {GRANULARITIES[granularity]} AS period, category_id, SUM(duration) AS hours
+                FROM {{schema}}.daily_category_totals WHERE date BETWEEN ? AND ?{where}
+                GROUP BY period, category_id
+            ''', params)
+            rows = conn.execute(f'''
+                SELECT t.period, c.name, t.hours FROM ({sql}) t
+                JOIN categories c ON c.id = t.category_id
+            ''', params).fetchall()
+
+        if not rows:
+            categories = categories if categories is not None else []
+            values = np.zeros((len(periods), len(categories)))
+            values.flags.writeable = False
+            return Summary(periods, categories, values)
+
+        row_periods, row_categories, hours = (np.array(column) for column in zip(*rows))
+        if categories is None:
+            category_labels, category_index = np.unique(row_categories, return_inverse=True)
+            categories = category_labels.tolist()
+        else:
+            order = np.argsort(categories)
+            category_index = order[np.searchsorted(np.array(categories)[order], row_categories)]
+        values = np.zeros((len(periods), len(categories)))
+        np.add.at(values, (np.searchsorted(periods, row_periods), category_index), hours)
+        # Results are cached and shared between callers
+        values.flags.writeable = False
+        return Summary(periods, categories, values)
 
-    # New Summary Methods for Different Time Ranges
     def get_last_7_days_summary(self):
-        last_7_days = str(date.today() - timedelta(days=7))
-        cursor = self.conn.execute('''
-            SELECT date, category, SUM(duration) FROM activities
-            WHERE date >= ? GROUP BY date, category ORDER BY date ASC
-        ''', (last_7_days,))
-        data = cursor.fetchall()
-        summary = {}
-        for record_date, category, duration in data:
-            if record_date not in summary:
-                summary[record_date] = {}
-            summary[record_date][category] = duration
-        return summary
+        return self._summary_since(date.today() - timedelta(days=7))
 
     def get_last_30_days_summary(self):
-        last_30_days = str(date.today() - timedelta(days=30))
-        cursor = self.conn.execute('''
-            SELECT date, category, SUM(duration) FROM activities
-            WHERE date >= ? GROUP BY date, category ORDER BY date ASC
-        ''', (last_30_days,))
-        data = cursor.fetchall()
-        summary = {}
-        for record_date, category, duration in data:
-            if record_date not in summary:
-                summary[record_date] = {}
-            summary[record_date][category] = duration
-        return summary
+        return self._summary_since(date.today() - timedelta(days=30))
 
     def get_last_365_days_summary(self):
-        last_365_days = str(date.today() - timedelta(days=365))
-        cursor = self.conn.execute('''
-            SELECT date, category, SUM(duration) FROM activities
-            WHERE date >= ? GROUP BY date, category ORDER BY date ASC
-        ''', (last_365_days,))
-        data = cursor.fetchall()
+        return self._summary_since(date.today() - timedelta(days=365))
+
+    def _summary_since(self, start):
+        """Returns {date: {category: hours}} for every date from start on, in date order."""
         summary = {}
-        for record_date, category, duration in data:
-            if record_date not in summary:
-                summary[record_date] = {}
-            summary[record_date][category] = duration
+        for record_date, category, hours in sorted(self.get_daily_totals(start, ALL_DATES[1])):
+            summary.setdefault(record_date, {})[category] = hours
         return summary
 
+    # Rollup maintenance
+    @timed()
+    def rebuild_daily_totals(self):
+        """Recomputes daily_category_totals from the raw activities."""
+        with self._write() as conn:
+            conn.execute('DELETE FROM daily_category_totals')
+            conn.execute('''
+                INSERT INTO daily_category_totals (date, category_id, duration, entries)
+                SELECT date, category_id, SUM(duration), COUNT(*) FROM activities
+                GROUP BY date, category_id
+            ''')
+
+    @timed()
+    def check_daily_totals(self, tolerance=1e-6):
+        """
+        Compares daily_category_totals against the raw activities.
+        Returns List[Tuple(date, category, expected_hours, rollup_hours)] for
+        every mismatch; a missing row on either side is reported as None.
+        """
+        with self.connections.connection() as conn:
+            return conn.execute('''
+                WITH raw AS (
+                    SELECT date, category_id, SUM(duration) AS duration, COUNT(*) AS entries
+                    FROM activities GROUP BY date, category_id
+                ), mismatches AS (
+                    SELECT raw.date, raw.category_id, raw.duration AS expected, t.duration AS actual
+                    FROM raw LEFT JOIN daily_category_totals t
+                        ON t.date = raw.date AND t.category_id = raw.category_id
+                    WHERE t.date IS NULL OR t.entries != raw.entries
+                        OR ABS(t.duration - raw.duration) > ?
+                    UNION ALL
+                    SELECT t.date, t.category_id, NULL, t.duration
+                    FROM daily_category_totals t LEFT JOIN raw
+                        ON raw.date = t.date AND raw.category_id = t.category_id
+                    WHERE raw.date IS NULL
+                )
+                SELECT m.date, c.name, m.expected, m.actual
+                FROM mismatches m LEFT JOIN categories c ON c.id = m.category_id
+            ''', (tolerance,)).fetchall()
+
+    # Activity Details
+    @timed()
+    def save_activity_details(self, source_id, payload, average_hr=None, max_hr=None, distance_km=None,
+                              calories=None):
+        """
+        Stores the full detail of the activity imported as source_id,
+        replacing any stored before. payload is JSON-serialisable and stored
+        compressed; the numbers are kept in their own columns for aggregates.
+        """
+        blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        with self._write(tags={'activity_details'}) as conn:
+            conn.execute('''
+                INSERT INTO activity_details (source_id, fetched_at, average_hr, max_hr, distance_km, calories, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source_id) DO UPDATE SET
+                    fetched_at=excluded.fetched_at, average_hr=excluded.average_hr, max_hr=excluded.max_hr,
+                    distance_km=excluded.distance_km, calories=excluded.calories, payload=excluded.payload
+            ''', (source_id, datetime.now().isoformat(timespec='seconds'), average_hr, max_hr, distance_km,
+                  calories, blob))
+
+    @timed()
+    def get_activity_details(self, source_id):
+        """Returns the ActivityDetails stored for source_id, or None if they haven't been fetched."""
+        with self.connections.connection() as conn:
+            row = conn.execute('''
+                SELECT source_id, fetched_at, average_hr, max_hr, distance_km, calories, payload
+                FROM activity_details WHERE source_id = ?
+            ''', (source_id,)).fetchone()
+        if row is None:
+            return None
+        return ActivityDetails(*row[:-1], json.loads(zlib.decompress(row[-1])))
+
+    @timed()
+    @cached(span=lambda start, end: (start, end), tags=('activity_details',))
+    def get_detail_totals(self, start, end):
+        """
+        Totals the fetched details of the records in start..end inclusive,
+        per category. Average heart rate is weighted by duration.
+        Returns List[Tuple(category, activities, distance_km, calories, average_hr)]
+        """
+        start, end = str(start), str(end)
+        with self.connections.connection() as conn:
+            activities = self._union(self._sources(conn, start, end), 'activities',
+                                     'date, category_id, duration, source_id')
+            return conn.execute(f'''
+                SELECT c.name, t.activities, t.distance_km, t.calories, t.average_hr FROM (
+                    SELECT a.category_id, COUNT(*) AS activities, SUM(d.distance_km) AS distance_km,
+                           SUM(d.calories) AS calories,
+                           SUM(d.average_hr * a.duration) / SUM(IIF(d.average_hr IS NULL, NULL, a.duration))
+                               AS average_hr
+                    FROM {activities} a JOIN activity_details d ON d.source_id = a.source_id
+                    WHERE a.date BETWEEN ? AND ?
+                    GROUP BY a.category_id
+                ) t
+                JOIN categories c ON c.id = t.category_id
+                ORDER BY c.name
+            ''', (start, end)).fetchall()
+
+    # Archive Methods
+    # Closed years can be moved out of the main database into one file per
+    # year, so the hot tables only hold recent history. Reads attach the
+    # archives their date range overlaps and query them together with the
+    # main database; anything within the current year never touches one.
+
+    def _archives(self):
+        """{year: (path, rows, max_id)} of the archived years."""
+        archives = self._archive_list
+        if archives is None:
+            with self.connections.connection() as conn:
+                archives = {year: (path, rows, max_id) for year, path, rows, max_id in conn.execute('''
+                    SELECT year, path, rows, max_id FROM archives
+                ''')}
+            self._archive_list = archives
+        return archives
+
+    def _reset_archives(self):
+        self._archive_list = None
+        self._archive_generation += 1
+
+    def _archive_path(self, name):
+        """Absolute path of an archive file, which lives next to the main database."""
+        return os.path.join(os.path.dirname(os.path.abspath(self.connections.db_path)), name)
+
+    def _archive_target(self, name):
+        """What to ATTACH for an archive file; read-only managers open it read-only too."""
+        path = self._archive_path(name)
+        if self.connections.read_only:
+            return pathlib.Path(path).as_uri() + '?mode=ro'
+        return path
+
+    @staticmethod
+    def _detach(conn, schema):
+        if any(row[1] == schema for row in conn.execute('PRAGMA database_list')):
+            conn.execute(f'DETACH DATABASE {schema}')
+
+    def _attach(self, conn, years):
+        """
+        Attaches the archives of `years` to conn as archive_<year>, detaching
+        ones attached earlier as needed to stay within MAX_ATTACHED.
+        Returns their schema names.
+        """
+        if not years:
+            return []
+        if len(years) > MAX_ATTACHED:
+            raise ValueError(f"A query can span at most {MAX_ATTACHED} archived years; "
+                             "narrow the date range or restore some years")
+        archives = self._archives()
+        generation = self._archive_generation
+        wanted = {f'archive_{year}': year for year in years}
+        attached = {row[1] for row in conn.execute('PRAGMA database_list')} - {'main', 'temp'}
+        if self._attached.get(id(conn)) != generation:
+            # Archives were added or removed since; a file may have been replaced
+            stale = set(attached)
+        else:
+            stale = attached - wanted.keys() if len(attached | wanted.keys()) > MAX_ATTACHED else set()
+        for schema in stale:
+            conn.execute(f'DETACH DATABASE {schema}')
+        attached -= stale
+        for schema, year in wanted.items():
+            if schema not in attached:
+                conn.execute(f'ATTACH DATABASE ? AS {schema}', (self._archive_target(archives[year][0]),))
+        self._attached[id(conn)] = generation
+        return list(wanted)
+
+    def _sources(self, conn, start, end):
+        """
+        Schemas holding the activities of start..end: main, plus the archives
+        of the archived years in the range, which are attached to conn.
+        """
+        try:
+            first, last = int(str(start)[:4]), int(str(end)[:4])
+        except ValueError:
+            raise ValueError(f"Dates must be YYYY-MM-DD, got {start!r} and {end!r}") from None
+        return ['main'] + self._attach(conn, [year for year in sorted(self._archives()) if first <= year <= last])
+
+    @staticmethod
+    def _union(sources, table, columns):
+        """
+        What to select `columns` of `table` FROM across `sources`: the table
+        itself when only main is involved, otherwise a UNION ALL of the
+        sources, into every arm of which SQLite pushes the outer WHERE.
+        """
+        if len(sources) == 1:
+            return table
+        return '(' + ' UNION ALL '.join(f'SELECT {columns} FROM {schema}.{table}' for schema in sources) + ')'
+
+    @staticmethod
+    def _each_source(sources, sql, params, compound='UNION ALL'):
+        """
+        Repeats sql once per source, with {schema} standing for it, joined by
+        `compound`. Returns the statement and its parameters. Unlike _union,
+        each arm can aggregate on its own, reading its table in index order.
+        """
+        return (f' {compound} '.join(sql.format(schema=schema) for schema in sources),
+                list(params) * len(sources))
+
+    @staticmethod
+    def _has_unarchived(conn, sources):
+        """Whether the main database has records written for any of the archived years in sources since."""
+        for schema in sources[1:]:
+            year = schema.removeprefix('archive_')
+            if conn.execute('''
+                SELECT 1 FROM main.daily_category_totals WHERE date BETWEEN ? AND ? LIMIT 1
+            ''', (f'{year}-01-01', f'{year}-12-31')).fetchone():
+                return True
+        return False
+
+    def _spans(self, start, end):
+        """
+        Splits start..end (YYYY-MM-DD) into consecutive ranges that each
+        overlap at most one archived year, for reads over all of history.
+        """
+        spans = []
+        for year in sorted(self._archives()):
+            year_start, year_end = f'{year:04d}-01-01', f'{year:04d}-12-31'
+            if year_end < start or year_start > end:
+                continue
+            if start < year_start:
+                spans.append((start, f'{year - 1:04d}-12-31'))
+            spans.append((max(start, year_start), min(end, year_end)))
+            start = f'{year + 1:04d}-01-01'
+        if start <= end:
+            spans.append((start, end))
+        return spans
+
+    def _archived_source_ids(self, rows):
+        """Returns the source_ids of (source_id, date, ...) rows that are already in an archive."""
+        archives = self._archives()
+        by_year = {}
+        for row in rows:
+            year = int(str(row[1])[:4])
+            if row[0] is not None and year in archives:
+                by_year.setdefault(year, []).append(row[0])
+        found = set()
+        with self.connections.connection() as conn:
+            for year, source_ids in by_year.items():
+                schema = self._attach(conn, [year])[0]
+                for i in range(0, len(source_ids), 500):
+                    batch = source_ids[i:i + 500]
+                    found.update(row[0] for row in conn.execute(f'''
+                        SELECT source_id FROM {schema}.activities
+                        WHERE source_id IN ({', '.join('?' * len(batch))})
+                    ''', batch))
+        return found
+
+    def _check_not_archived(self, activity_id):
+        """Raises ValueError if activity_id is in an archive."""
+        with self.connections.connection() as conn:
+            for year, (path, rows, max_id) in sorted(self._archives().items()):
+                if activity_id > max_id:
+                    continue
+                schema = self._attach(conn, [year])[0]
+                if conn.execute(f'SELECT 1 FROM {schema}.activities WHERE id = ?', (activity_id,)).fetchone():
+                    raise ValueError(f"Record {activity_id} is archived with {year}; restore the year to change it")
+
+    def get_archives(self):
+        """Returns List[Tuple(year, path, rows, read_only)] of the archived years, oldest first."""
+        archives = []
+        for year, (name, rows, max_id) in sorted(self._archives().items()):
+            path = self._archive_path(name)
+            read_only = os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWUSR
+            archives.append((year, path, rows, read_only))
+        return archives
+
+    @timed()
+    def archive_year(self, year, read_only=False, vacuum=True):
+        """
+        Moves the activities of a closed year (any before the current one)
+        into their own database file next to the main one, with the same
+        indexes and its own daily rollup. The file is compacted with VACUUM
+        unless `vacuum` is False, and `read_only` also takes away its write
+        permission. Records written for the year later land in the main
+        database; archiving the year again moves them over too.
+        Returns the number of records moved.
+        """
+        year = int(year)
+        if self.connections.read_only:
+            raise ValueError("Cannot archive through a read-only connection")
+        if year >= date.today().year:
+            raise ValueError(f"Only years before {date.today().year} can be archived")
+        archive = self._archives().get(year)
+        root, ext = os.path.splitext(os.path.basename(self.connections.db_path))
+        name = archive[0] if archive else f'{root}-{year}{ext or ".db"}'
+        path = self._archive_path(name)
+        if os.path.exists(path):
+            if archive is None:
+                # Left behind by an archive_year that didn't finish; nothing reads it
+                os.remove(path)
+            else:
+                os.chmod(path, os.stat(path).st_mode | stat.S_IWUSR)
+        start, end = f'{year:04d}-01-01', f'{year:04d}-12-31'
+        schema = f'archive_{year}'
+        with self.connections.connection() as conn:
+            self._detach(conn, schema)
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+            try:
+                # Copy first. Until the archive is registered below nothing
+                # reads it, so an interruption here loses nothing.
+                with conn:
+                    conn.execute(f'''
+                        CREATE TABLE IF NOT EXISTS {schema}.activities (
+                            id INTEGER PRIMARY KEY,
+                            date TEXT,
+                            category_id INTEGER NOT NULL,
+                            activity_name_id INTEGER NOT NULL,
+                            duration REAL,
+                            source_id INTEGER
+                        )
+                    ''')
+                    # A record re-imported since the year was archived replaces its old copy
+                    count = conn.execute(f'''
+                        INSERT OR REPLACE INTO {schema}.activities ({ACTIVITY_COLUMNS})
+                        SELECT {ACTIVITY_COLUMNS} FROM main.activities
+                        WHERE date BETWEEN ? AND ? ORDER BY date, id
+                    ''', (start, end)).rowcount
+                    # Indexed after the bulk copy, which is faster than maintaining them during it
+                    conn.execute(f'''
+                        CREATE INDEX IF NOT EXISTS {schema}.idx_activities_date_category
+                        ON activities (date, category_id, activity_name_id, duration)
+                    ''')
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_activities_date ON activities (date)')
+                    conn.execute(f'''
+                        CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_activities_source_id ON activities (source_id)
+                    ''')
+                    conn.execute(f'''
+                        CREATE TABLE IF NOT EXISTS {schema}.daily_category_totals (
+                            date TEXT NOT NULL,
+                            category_id INTEGER NOT NULL,
+                            duration REAL NOT NULL,
+                            entries INTEGER NOT NULL,
+                            PRIMARY KEY (date, category_id)
+                        ) WITHOUT ROWID
+                    ''')
+                    conn.execute(f'DELETE FROM {schema}.daily_category_totals')
+                    conn.execute(f'''
+                        INSERT INTO {schema}.daily_category_totals ({TOTALS_COLUMNS})
+                        SELECT date, category_id, SUM(duration), COUNT(*) FROM {schema}.activities
+                        GROUP BY date, category_id
+                    ''')
+                if vacuum:
+                    conn.execute(f'VACUUM {schema}')
+
+                with self._write() as conn:
+                    # The year's rollup rows go first so the delete trigger has nothing
+                    # to update for each row, and are rebuilt for any record written
+                    # since the copy, which stays behind
+                    conn.execute('DELETE FROM daily_category_totals WHERE date BETWEEN ? AND ?', (start, end))
+                    conn.execute(f'''
+                        DELETE FROM activities
+                        WHERE date BETWEEN ? AND ? AND id IN (SELECT id FROM {schema}.activities)
+                    ''', (start, end))
+                    conn.execute('''
+                        INSERT INTO daily_category_totals (date, category_id, duration, entries)
+                        SELECT date, category_id, SUM(duration), COUNT(*) FROM activities
+                        WHERE date BETWEEN ? AND ? GROUP BY date, category_id
+                    ''', (start, end))
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO archives (year, path, rows, max_id)
+                        SELECT ?, ?, COUNT(*), IFNULL(MAX(id), 0) FROM {schema}.activities
+                    ''', (year, name))
+            finally:
+                self._detach(conn, schema)
+                self._reset_archives()
+        if read_only:
+            os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        return count
+
+    @timed()
+    def restore_year(self, year):
+        """
+        Moves an archived year's activities back into the main database and
+        deletes its archive file. Returns the number of records moved.
+        """
+        year = int(year)
+        if self.connections.read_only:
+            raise ValueError("Cannot restore through a read-only connection")
+        archive = self._archives().get(year)
+        if archive is None:
+            raise ValueError(f"{year} is not archived")
+        with self.connections.connection() as conn:
+            schema = self._attach(conn, [year])[0]
+            try:
+                with self._write() as conn:
+                    # A record re-imported into the main database since is the newer copy
+                    count = conn.execute(f'''
+                        INSERT OR IGNORE INTO activities ({ACTIVITY_COLUMNS})
+                        SELECT {ACTIVITY_COLUMNS} FROM {schema}.activities ORDER BY date, id
+                    ''').rowcount
+                    conn.execute('DELETE FROM archives WHERE year = ?', (year,))
+            finally:
+                self._detach(conn, schema)
+                self._reset_archives()
+        os.remove(self._archive_path(archive[0]))
+        return count
+
+    @timed()
+    def vacuum(self):
+        """Rebuilds the main database file, returning the space archived years took to the filesystem."""
+        with self.connections.connection() as conn:
+            conn.execute('VACUUM')
+
     # Category Methods
+    @timed()
     def add_category(self, category_name):
         try:
-            with self.conn:
-                self.conn.execute('''
+            with self._write(tags={'categories'}) as conn:
+                conn.execute('''
                     INSERT INTO categories (name) VALUES (?)
                 ''', (category_name,))
         except sqlite3.IntegrityError:
-            pass  # Category already exists
+            return  # Category already exists
+        index = self._category_index
+        if index is not None:
+            index.add(category_name)
 
+    @timed()
+    @cached(tags=('categories',))
     def get_categories(self):
-        cursor = self.conn.execute('''
-            SELECT name FROM categories
-        ''')
-        return [row[0] for row in cursor.fetchall()]
+        with self.connections.connection() as conn:
+            # The empty name stands for "no category" on uncategorised records
+            rows = conn.execute('''
+                SELECT name FROM categories WHERE name != ''
+            ''').fetchall()
+        return [row[0] for row in rows]
+
+    @timed()
+    @cached(tags=('category_groups',))
+    def get_category_groups(self):
+        """Returns {category: group_name} for every category assigned to a KPI group."""
+        with self.connections.connection() as conn:
+            return dict(conn.execute('''
+                SELECT c.name, g.group_name FROM category_groups g
+                JOIN categories c ON c.id = g.category_id
+            ''').fetchall())
+
+    @timed()
+    def set_category_group(self, category, group_name):
+        """Puts category in one of CATEGORY_GROUPS, or takes it out of its group when group_name is None."""
+        if group_name is not None and group_name not in CATEGORY_GROUPS:
+            raise ValueError(f"Unknown category group {group_name!r}")
+        tags = {'category_groups'}
+        new_categories = ()
+        with self._write(tags=tags) as conn:
+            if group_name is None:
+                conn.execute('''
+                    DELETE FROM category_groups WHERE category_id = (SELECT id FROM categories WHERE name = ?)
+                ''', (category,))
+            else:
+                new_categories = self._intern(conn, tags, [category])
+                conn.execute('''
+                    INSERT INTO category_groups (category_id, group_name)
+                    VALUES ((SELECT id FROM categories WHERE name = ?), ?)
+                    ON CONFLICT (category_id) DO UPDATE SET group_name = excluded.group_name
+                ''', (category, group_name))
+        self._index_categories(new_categories)
+
+    @timed()
+    def search_categories(self, search_term, limit=None):
+        """Returns category names matching search_term, best matches first."""
+        if self._category_fts is None:
+            with self.connections.connection() as conn:
+                has_fts = conn.execute('''
+                    SELECT 1 FROM sqlite_master WHERE name = 'categories_fts'
+                ''').fetchone() is not None
+                count = conn.execute('SELECT COUNT(*) FROM categories').fetchone()[0]
+            self._category_fts = has_fts and count > self.CATEGORY_FTS_THRESHOLD
+        if self._category_fts:
+            return self._search_categories_fts(search_term, limit)
+
+        index = self._category_index
+        if index is None:
+            index = self._category_index = CategoryIndex(self.get_categories())
+        return index.search(search_term, limit)
 
-    def search_categories(self, search_term):
-        cursor = self.conn.execute('''
-            SELECT name FROM categories WHERE name LIKE ?
-        ''', (f'%{search_term}%',))
-        return [row[0] for row in cursor.fetchall()]
+    def _search_categories_fts(self, search_term, limit):
+        term = search_term.lower()
+        with self.connections.connection() as conn:
+            if len(term) < 3:
+                # Trigrams need at least three characters; fall back to a prefix scan
+                rows = conn.execute('''
+                    SELECT name FROM categories WHERE name LIKE ? ESCAPE '\\'
+                    ORDER BY length(name) LIMIT ?
+                ''', (term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',
+                      -1 if limit is None else limit)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT name FROM categories_fts WHERE categories_fts MATCH ?
+                    ORDER BY instr(lower(name), ?), length(name) LIMIT ?
+                ''', ('"' + term.replace('"', '""') + '"', term,
+                      -1 if limit is None else limit)).fetchall()
+        return [row[0] for row in rows]
 
     def close(self):
-        self.conn.close()
+        self.connections.close()
 
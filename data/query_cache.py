@@ -0,0 +1,126 @@
+import bisect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+# Span for results that depend on every date, e.g. the list of dates itself
+ALL_DATES = ('0000-00-00', '9999-99-99')
+
+class QueryCache:
+    """
+    Bounded LRU cache of query results keyed by method name and arguments.
+
+    Every entry records the span of dates its result was computed from, or the
+    tags of the non-dated tables it read, so a write only evicts the entries
+    it can actually have changed.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidation; lets put() drop results computed
+        # while a write was landing
+        self.generation = 0
+        self._entries = OrderedDict()  # key -> (value, span, tags)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (True, value) on a hit, (False, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, span=None, tags=(), generation=None):
+        """
+        span: (first_date, last_date) ISO strings the result depends on, inclusive.
+        generation: value of self.generation read before the query ran.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, span, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_dates(self, dates):
+        """Evicts every entry whose span covers any of `dates` (ISO strings)."""
+        dates = sorted(set(dates))
+        if not dates:
+            return
+        with self._lock:
+            self.generation += 1
+            for key, (_, span, _) in list(self._entries.items()):
+                if span is None:
+                    continue
+                i = bisect.bisect_left(dates, span[0])
+                if i < len(dates) and dates[i] <= span[1]:
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self.generation += 1
+            for key, (_, _, tags) in list(self._entries.items()):
+                if tag in tags:
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def cached(span=None, tags=()):
+    """
+    Caches a DataManager read method in self.cache. span(*args, **kwargs)
+    returns the (first_date, last_date) the result depends on; methods that
+    read no dated rows pass tags instead. Cached results are shared between
+    callers and must be treated as read-only.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (method.__name__, _freeze(args), _freeze(sorted(kwargs.items())))
+            found, value = self.cache.get(key)
+            if found:
+                return value
+            generation = self.cache.generation
+            value = method(self, *args, **kwargs)
+            covered = None
+            if span is not None:
+                first, last = span(*args, **kwargs)
+                covered = (str(first), str(last))
+            self.cache.put(key, value, covered, tags, generation)
+            return value
+        return wrapper
+    return decorator
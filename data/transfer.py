@@ -0,0 +1,119 @@
+"""
+Streaming readers and writers for moving activities in and out of the
+database as CSV, JSON Lines or Parquet. Readers yield one record at a time
+and writers consume batches, so memory stays flat whatever the file size.
+"""
+import csv
+import json
+import os
+from datetime import date
+
+# Column order of every format
+FIELDS = ('date', 'category', 'activity', 'duration', 'source_id')
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'json' or extension == 'ndjson':
+        extension = 'jsonl'
+    if extension not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path!r}; use one of {', '.join(FORMATS)}")
+    return extension
+
+def validate(record, number):
+    """
+    Checks one raw record (a dict keyed by FIELDS) and returns it as
+    (date, activity, duration, category, source_id). Raises ValueError naming
+    the record number on bad input.
+    """
+    try:
+        record_date = date.fromisoformat(str(record['date'])).isoformat()
+        duration = float(record['duration'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Record {number}: invalid date or duration ({e})") from None
+    if duration < 0:
+        raise ValueError(f"Record {number}: negative duration")
+    source_id = record.get('source_id')
+    if source_id in (None, ''):
+        source_id = None
+    else:
+        try:
+            source_id = int(source_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"Record {number}: source_id must be an integer") from None
+    return (record_date, record.get('activity') or "", duration, record.get('category') or "", source_id)
+
+def read_records(path, fmt=None):
+    """Yields validated (date, activity, duration, category, source_id) tuples from a file."""
+    fmt = fmt or detect_format(path)
+    if fmt == 'csv':
+        raw = _read_csv(path)
+    elif fmt == 'jsonl':
+        raw = _read_jsonl(path)
+    else:
+        raw = _read_parquet(path)
+    for number, record in enumerate(raw, start=1):
+        yield validate(record, number)
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = {'date', 'duration'} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{path}: missing columns {', '.join(sorted(missing))}")
+        yield from reader
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _read_parquet(path):
+    pq = _import_parquet()
+    for batch in pq.ParquetFile(path).iter_batches():
+        yield from batch.to_pylist()
+
+def write_records(path, batches, fmt=None):
+    """
+    Writes batches of rows ordered as FIELDS to path.
+    Returns the number of rows written.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt == 'parquet':
+        return _write_parquet(path, batches)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for batch in batches:
+                writer.writerows(batch)
+                count += len(batch)
+        else:
+            for batch in batches:
+                f.writelines(json.dumps(dict(zip(FIELDS, row))) + '\n' for row in batch)
+                count += len(batch)
+    return count
+
+def _write_parquet(path, batches):
+    pq = _import_parquet()
+    import pyarrow as pa
+
+    schema = pa.schema([('date', pa.string()), ('category', pa.string()), ('activity', pa.string()),
+                        ('duration', pa.float64()), ('source_id', pa.int64())])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            columns = list(zip(*batch)) if batch else [[] for _ in FIELDS]
+            writer.write_table(pa.Table.from_arrays([pa.array(c, type=t) for c, t in zip(columns, schema.types)],
+                                                    schema=schema))
+            count += len(batch)
+    return count
+
+def _import_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet import/export needs pyarrow (pip install pyarrow)") from None
+    return pq
@@ -0,0 +1,252 @@
+"""
+Timings for SQL statements, Garmin calls and chart drawing.
+
+Everything reports into METRICS. SQL is timed per statement by connections
+made with InstrumentedConnection; statements slower than SLOW_QUERY_MS are
+logged along with their EXPLAIN QUERY PLAN. Other code is timed with the
+`timed` decorator or the `timer` context manager. The Diagnostics tab shows
+the numbers, and setting TIME_TRACKER_METRICS_FILE makes the app write them
+to that file as JSON on exit.
+"""
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('TIME_TRACKER_SLOW_QUERY_MS', '50'))
+METRICS_FILE = os.getenv('TIME_TRACKER_METRICS_FILE')
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def _summarize(count, total, peak, recent):
+    ordered = sorted(recent)
+    return {
+        'count': count,
+        'total_ms': total * 1000,
+        'mean_ms': total / count * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'max_ms': peak * 1000,
+    }
+
+class Metrics:
+    """
+    Thread-safe registry of timings. Each name keeps its count, total and
+    maximum, plus the most recent `recent` samples for percentiles.
+    """
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, recent=256, slow_log_size=100):
+        self.slow_query_ms = slow_query_ms
+        self.recent = recent
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._timings = {}  # name -> [count, total, max, deque of recent seconds]
+        self._queries = {}  # normalized SQL -> same
+        self._lock = threading.Lock()
+
+    def _add(self, table, key, seconds):
+        with self._lock:
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [0, 0.0, 0.0, deque(maxlen=self.recent)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3].append(seconds)
+
+    def record(self, name, seconds):
+        self._add(self._timings, name, seconds)
+
+    def record_query(self, sql, seconds, explain=None, rows=None):
+        """
+        Records one statement, or with `rows` one executemany() batch that
+        changed that many rows, which is slow when its time per row is and
+        then only logged if it has a plan. explain() returns the query plan
+        lines and is only called when the statement was slow.
+        """
+        sql = ' '.join(sql.split())
+        self._add(self._queries, sql, seconds)
+        per_statement = seconds if rows is None else seconds / max(rows, 1)
+        if per_statement * 1000 < self.slow_query_ms:
+            return
+        plan = None
+        if explain is not None:
+            try:
+                plan = explain()
+            except sqlite3.Error:
+                pass
+        if rows is not None and not plan:
+            return  # A slow batch is only worth logging with a plan to show why
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ms': seconds * 1000,
+            'sql': sql,
+            'rows': rows,
+            'plan': plan,
+            'thread': threading.current_thread().name,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        logger.warning("Slow query (%.1f ms%s): %s\n  plan: %s", entry['ms'],
+                       '' if rows is None else f' for {rows} rows', sql, '; '.join(plan) if plan else 'n/a')
+
+    def snapshot(self):
+        """Returns every timing, per-statement totals and the slow-query log as plain data."""
+        with self._lock:
+            timings = {name: _summarize(*entry) for name, entry in self._timings.items()}
+            queries = [dict(sql=sql, **_summarize(*entry)) for sql, entry in self._queries.items()]
+            slow = list(self.slow_queries)
+        queries.sort(key=lambda query: -query['total_ms'])
+        return {'timings': timings, 'queries': queries, 'slow_queries': slow}
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._queries.clear()
+            self.slow_queries.clear()
+
+    def export(self, path, **extra):
+        """Writes snapshot() plus `extra` fields to path as JSON."""
+        data = dict(exported=time.strftime('%Y-%m-%dT%H:%M:%S%z'), **extra, **self.snapshot())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+METRICS = Metrics()
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.record(name, time.perf_counter() - start)
+
+def timed(name=None):
+    """Times every call of the decorated function under `name` (default: its qualified name)."""
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.record(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Times each statement from execute() until its rows have been fetched, so
+    the cost of stepping through results is counted too. The time is
+    reported once the rows run out, the next statement starts or the cursor
+    is closed or dropped.
+    """
+    _sql = None
+    _parameters = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._parameters = sql, parameters
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def executemany(self, sql, seq_of_parameters):
+        """Times the whole batch, which is recorded with the number of rows it changed."""
+        self._finish()
+        # The parameters may be a one-shot iterator: the first set is taken
+        # off it for the plan and chained back on
+        parameters = iter(seq_of_parameters)
+        first = next(parameters, None)
+        if first is not None:
+            parameters = itertools.chain((first,), parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            METRICS.record_query(sql, elapsed, self._explainer(sql, first), rows=max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - start
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        parameters, elapsed = self._parameters, self._elapsed
+        self._sql, self._parameters, self._elapsed = None, None, 0.0
+        METRICS.record_query(sql, elapsed, self._explainer(sql, parameters))
+
+    def _explainer(self, sql, parameters):
+        """Returns the explain() record_query() takes for sql run with parameters, or None."""
+        if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+
+        def explain():
+            # A plain cursor, so the plan lookup is not itself recorded
+            rows = sqlite3.Cursor(self.connection).execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+            return [row[-1] for row in rows]
+        return explain
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose statements are timed by InstrumentedCursor."""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -1,9 +1,17 @@
+import logging
 import tkinter as tk
 from tkinter import ttk
 from ui.home_tab import HomeTab
 from ui.edit_tab import EditTab
 from ui.summary_tab import SummaryTab
+from ui.diagnostics_tab import DiagnosticsTab
 from apis.garmin import GarminRequest
+from apis.garmin_sync import GarminSync
+from data.connection import ConnectionManager
+from data.data_manager import DataManager
+from ui.async_data import AsyncDataManager
+from ui.background import BackgroundRunner
+from instrumentation import METRICS, METRICS_FILE
 
 class TimeTrackerApp(tk.Tk):
     def __init__(self):
@@ -15,14 +23,27 @@ class TimeTrackerApp(tk.Tk):
         self.notebook.pack(expand=True, fill='both')
         self.garminRequest = GarminRequest()
 
-        # Adding tabs
-        self.home_tab = HomeTab(self.notebook, self.garminRequest)
-        self.edit_tab = EditTab(self.notebook, self.garminRequest)
-        self.summary_tab = SummaryTab(self.notebook)
+        # One pool of connections shared by every tab
+        self.connections = ConnectionManager()
+        self.data_manager = DataManager(connections=self.connections)
+        self.garmin_sync = GarminSync(self.garminRequest, self.data_manager)
+        # Worker threads for Garmin syncs and other slow jobs
+        self.runner = BackgroundRunner(self)
+        # The tabs' queries and edits, run on their own thread so Tk never waits on SQLite
+        self.queries = AsyncDataManager(self, self.data_manager)
 
-        self.notebook.add(self.home_tab, text="Home")
-        self.notebook.add(self.edit_tab, text="Edit Data")
-        self.notebook.add(self.summary_tab, text="Summary")
+        # Adding tabs. Each starts as an empty frame and is built the first
+        # time it is selected, so startup only pays for the visible one
+        self.tab_factories = {
+            "Home": lambda parent: HomeTab(parent, self.data_manager, self.garmin_sync, self.runner, self.queries),
+            "Edit Data": lambda parent: EditTab(parent, self.data_manager, self.garmin_sync, self.runner,
+                                                self.queries),
+            "Summary": lambda parent: SummaryTab(parent, self.data_manager, self.queries),
+            "Diagnostics": lambda parent: DiagnosticsTab(parent, self.data_manager),
+        }
+        self.tabs = {}
+        for tab_text in self.tab_factories:
+            self.notebook.add(ttk.Frame(self.notebook), text=tab_text)
         # Bind the tab change event
         self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
 
@@ -30,16 +51,30 @@ class TimeTrackerApp(tk.Tk):
         selected_tab = event.widget.select()
         tab_text = event.widget.tab(selected_tab, "text")
 
-        # Call the update method for each specific tab when it's selected
-        if tab_text == "Home":
-            self.home_tab.update_chart()  # Refresh chart on home tab
-        elif tab_text == "Edit Data":
-            self.edit_tab.update_activity_list()  # Refresh activity list on edit tab
-        elif tab_text == "Summary":
-            self.summary_tab.update_chart()  # Refresh chart on summary tab
+        if tab_text not in self.tabs:
+            # A freshly built tab has already drawn itself
+            tab = self.tab_factories[tab_text](self.nametowidget(selected_tab))
+            tab.pack(expand=True, fill='both')
+            self.tabs[tab_text] = tab
+            return
+
+        # Each tab skips its queries and redraw when nothing has changed
+        self.tabs[tab_text].refresh()
+
+    def destroy(self):
+        if METRICS_FILE:
+            try:
+                METRICS.export(METRICS_FILE, cache=self.data_manager.cache_stats())
+            except OSError:
+                logging.getLogger(__name__).exception("Could not write metrics to %s", METRICS_FILE)
+        self.runner.shutdown()
+        self.queries.shutdown()
+        super().destroy()
+        self.connections.close()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     app = TimeTrackerApp()
     app.mainloop()
 
@@ -0,0 +1,77 @@
+import logging
+from ui.background import BackgroundRunner
+
+logger = logging.getLogger(__name__)
+
+class AsyncDataManager:
+    """
+    Runs DataManager queries and writes on one dedicated worker thread and
+    hands the results back to Tk, so the event loop never waits on SQLite.
+
+    Requests go through named channels, one per view that shows the result.
+    A new request on a channel supersedes the one before it: if that one has
+    not started it is skipped, and if it is already running its result is
+    dropped. Changing the Summary range twice quickly therefore only draws
+    the last range. Requests on channel None are never superseded; writes
+    use it. With a single worker, requests run in the order they were made,
+    so a read issued after a write sees it.
+    """
+    def __init__(self, widget, data_manager, poll_ms=10):
+        self.data_manager = data_manager
+        self.runner = BackgroundRunner(widget, max_workers=1, poll_ms=poll_ms)
+        self._latest = {}  # channel -> Task of its newest request; only touched on the Tk thread
+
+    def call(self, channel, method, *args, on_done=None, on_error=None, **kwargs):
+        """Runs data_manager.<method>(*args, **kwargs); see run()."""
+        return self.run(channel, getattr(self.data_manager, method), *args,
+                        on_done=on_done, on_error=on_error, **kwargs)
+
+    def run(self, channel, function, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Runs function(*args, **kwargs) on the worker thread. Unless superseded
+        meanwhile, on_done(result) or on_error(exception) is then called on
+        the Tk thread; errors without an on_error are logged.
+        Returns the Task handle.
+        """
+        self.cancel(channel)
+
+        def job(task):
+            if task.cancelled:
+                return None
+            return function(*args, **kwargs)
+
+        def done(result):
+            if self._finish(channel, task) and on_done is not None:
+                on_done(result)
+
+        def error(exception):
+            if not self._finish(channel, task):
+                return
+            if on_error is not None:
+                on_error(exception)
+            else:
+                logger.error("%s failed", getattr(function, '__qualname__', function), exc_info=exception)
+
+        task = self.runner.submit(job, on_done=done, on_error=error)
+        if channel is not None:
+            self._latest[channel] = task
+        return task
+
+    def _finish(self, channel, task):
+        """Returns whether the task's result should be delivered."""
+        if task.cancelled:
+            return False
+        if channel is not None and self._latest.get(channel) is task:
+            del self._latest[channel]
+        return True
+
+    def cancel(self, channel):
+        """Supersedes the pending request on channel, if any."""
+        if channel is None:
+            return
+        task = self._latest.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    def shutdown(self):
+        self.runner.shutdown()
@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class Task:
+    """Handle for a job running on a BackgroundRunner."""
+    def __init__(self, runner, on_progress):
+        self._runner = runner
+        self._on_progress = on_progress
+        self._cancelled = threading.Event()
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Asks the job to stop; it checks `cancelled` between steps."""
+        self._cancelled.set()
+
+    def report(self, *args):
+        """Called from the worker; delivers on_progress(*args) on the Tk thread."""
+        self._runner._post(self._on_progress, args)
+
+class BackgroundRunner:
+    """
+    Runs jobs on worker threads and hands their results back to Tk.
+
+    Workers never touch widgets: callbacks are queued and run by a poll loop
+    scheduled with `after()`, which only runs while jobs are outstanding.
+    """
+    def __init__(self, widget, max_workers=2, poll_ms=50):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background")
+        self._messages = queue.Queue()
+        self._active = 0
+        self._polling = False
+
+    def submit(self, job, *args, on_progress=None, on_done=None, on_error=None):
+        """
+        Runs job(task, *args) on a worker thread. on_done(result) or
+        on_error(exception) is then called on the Tk thread.
+        Returns the Task handle.
+        """
+        task = Task(self, on_progress)
+
+        def run():
+            try:
+                result = job(task, *args)
+            except Exception as e:
+                self._post(on_error, (e,))
+            else:
+                self._post(on_done, (result,))
+            finally:
+                self._post(self._finished, ())
+
+        self._active += 1
+        task.future = self._executor.submit(run)
+        self._schedule()
+        return task
+
+    def _post(self, callback, args):
+        if callback is not None:
+            self._messages.put((callback, args))
+
+    def _finished(self):
+        self._active -= 1
+
+    def _schedule(self):
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        self._polling = False
+        while True:
+            try:
+                callback, args = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            # One failing callback must not strand the messages queued after it
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("Background callback %s failed", getattr(callback, '__qualname__', callback))
+        if self._active > 0:
+            self._schedule()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
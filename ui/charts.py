@@ -0,0 +1,204 @@
+"""
+Chart drawing shared by the tabs. Only matplotlib and NumPy are used here,
+never a GUI toolkit, so the same code can render off-screen.
+"""
+import matplotlib
+import numpy as np
+
+def build_activity_matrix(data):
+    """
+    Turns {category: [(activity, hours)]} into (categories, activities, matrix)
+    where matrix[i, j] is the hours of activities[i] in categories[j].
+    """
+    categories = list(data)
+    activity_index = {}
+    rows, cols, values = [], [], []
+    for col, activities_data in enumerate(data.values()):
+        for activity, duration in activities_data:
+            rows.append(activity_index.setdefault(activity, len(activity_index)))
+            cols.append(col)
+            values.append(duration)
+    matrix = np.zeros((len(activity_index), len(categories)))
+    matrix[rows, cols] = values
+    return categories, list(activity_index), matrix
+
+# Summary charts stack at most this many series; smaller categories are summed into "Other"
+SUMMARY_MAX_SERIES = 10
+# Most period labels written under a Summary chart
+SUMMARY_MAX_TICKS = 12
+
+def top_categories(categories, values, max_series=SUMMARY_MAX_SERIES):
+    """
+    Orders the columns of a periods x categories matrix by total hours,
+    largest first, and sums all but the largest max_series - 1 into an
+    "Other" column when there are more than max_series.
+    Returns (categories, values).
+    """
+    order = np.argsort(-values.sum(axis=0), kind='stable')
+    categories = [categories[i] for i in order]
+    values = values[:, order]
+    if len(categories) > max_series:
+        keep = max_series - 1
+        categories = categories[:keep] + ['Other']
+        values = np.column_stack((values[:, :keep], values[:, keep:].sum(axis=1)))
+    return categories, values
+
+def draw_summary(ax, summary, title, max_series=SUMMARY_MAX_SERIES):
+    """
+    Draws a DataManager Summary on ax as bars per period stacked by category.
+    Each category is one PolyCollection holding all of its bars, built from
+    the periods x categories matrix at once, so the number of artists grows
+    with the categories shown rather than with periods x categories.
+    """
+    from matplotlib.collections import PolyCollection
+
+    ax.clear()
+    if summary is None or not summary.values.any():
+        ax.text(0.5, 0.5, "No Data Available", fontsize=12, ha='center')
+        return
+    categories, values = top_categories(summary.categories, summary.values, max_series)
+    periods = len(summary.periods)
+    x = np.arange(periods)
+    tops = np.cumsum(values, axis=1)
+    bottoms = tops - values
+    left, right = x - 0.4, x + 0.4
+    colors = matplotlib.colormaps['tab20']
+    for j, category in enumerate(categories):
+        # One rectangle per period with time in this category: (bars, 4 corners, xy)
+        keep = values[:, j] > 0
+        corners = np.stack((
+            np.column_stack((left, bottoms[:, j])),
+            np.column_stack((left, tops[:, j])),
+            np.column_stack((right, tops[:, j])),
+            np.column_stack((right, bottoms[:, j])),
+        ), axis=1)[keep]
+        ax.add_collection(PolyCollection(corners, facecolors=colors(j % colors.N), edgecolors='none',
+                                         label=category))
+
+    ax.set_xlim(-0.6, periods - 0.4)
+    # Headroom above the tallest bar for the two-column legend
+    legend_rows = -(-len(categories) // 2)
+    ax.set_ylim(0, tops[:, -1].max() * (1.05 + 0.07 * legend_rows))
+    step = -(-periods // SUMMARY_MAX_TICKS)
+    ax.set_xticks(x[::step])
+    ax.set_xticklabels(summary.periods[::step], rotation=45, ha='right', fontsize=8)
+    ax.set_title(title)
+    ax.set_ylabel('Total Hours')
+    ax.legend(fontsize=7, loc='upper left', ncols=2)
+
+class StackedBarChart:
+    """
+    Hours per category, stacked by activity, with each activity's name written
+    on its segment.
+
+    Only segments with time get a bar and a label, so the artists grow with
+    the activities logged rather than with activities x categories. They are
+    kept between updates: while the same cells have time only their heights
+    and positions are moved, which avoids clearing the axes and re-running
+    the layout.
+
+    With `blit`, bars and labels are animated artists: a full draw paints
+    everything else and saves it as the background, and updates that stay
+    within the y range paint just the bars and labels over it (see draw()).
+    """
+    def __init__(self, ax, title, blit=False):
+        self.ax = ax
+        self.title = title
+        self.blit = blit
+        self.layout = None
+        self.bars = []  # one Rectangle per cell with time
+        self.labels = []  # one Text per cell with time
+        # Axes pixels saved at the last full draw, without bars and labels
+        self.background = None
+        self.canvas = None
+        # Whether the next draw() has to redraw the whole figure
+        self.stale = True
+
+    def update(self, data):
+        """Draws data ({category: [(activity, hours)]}); returns True if the layout was rebuilt."""
+        categories, activities, matrix = build_activity_matrix(data)
+        bottoms = np.cumsum(matrix, axis=0) - matrix
+        rows, cols = np.nonzero(matrix > 0)
+        layout = (categories, activities, rows.tobytes(), cols.tobytes())
+        top = matrix.sum(axis=0).max(initial=0)
+        if layout == self.layout:
+            self._move(matrix[rows, cols], bottoms[rows, cols])
+            # The background holds the y axis, so a new range needs a full draw
+            self.stale |= self._fit_y(top)
+            return False
+        self._rebuild(categories, activities, rows, cols, matrix[rows, cols], bottoms[rows, cols])
+        self._fit_y(top, keep=False)
+        self.layout = layout
+        self.stale = True
+        return True
+
+    def draw(self, canvas):
+        """
+        Repaints canvas after update(). Without blit, or when the layout or
+        y range changed, the whole figure is redrawn when the GUI is next
+        idle. Otherwise only the bars and labels are redrawn over the saved
+        background and blitted.
+        """
+        if self.canvas is not canvas:
+            self.canvas = canvas
+            canvas.mpl_connect('draw_event', self._on_draw)
+            self.stale = True
+        if not self.blit or self.stale or self.background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        self._draw_animated()
+        canvas.blit(self.ax.bbox)
+
+    def _on_draw(self, event):
+        # Any full draw (updates, resizes) skips the animated artists; save
+        # what it painted, then paint them on top
+        self.stale = False
+        if self.blit:
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self.bars:
+            self.ax.draw_artist(artist)
+        for artist in self.labels:
+            self.ax.draw_artist(artist)
+
+    def _fit_y(self, top, keep=True):
+        """
+        Sets the y range to fit stacks up to `top` hours with some headroom;
+        returns True if it changed. With `keep`, a range that still fits the
+        bars closely enough is left alone, so small changes keep the axis.
+        """
+        low, high = self.ax.get_ylim()
+        if keep and low == 0 and top * 1.05 <= high <= max(top * 1.5, 1.0):
+            return False
+        self.ax.set_ylim(0, max(top * 1.2, 1.0))
+        return True
+
+    def _move(self, heights, bottoms):
+        for bar, label, height, y in zip(self.bars, self.labels, heights, bottoms):
+            bar.set_y(y)
+            bar.set_height(height)
+            label.set_y(y + height / 2)
+
+    def _rebuild(self, categories, activities, rows, cols, heights, bottoms):
+        self.ax.clear()
+        colors = matplotlib.colormaps['tab20']
+        x = np.arange(len(categories))
+        self.bars = list(self.ax.bar(cols, heights, bottom=bottoms, color=[colors(i % colors.N) for i in rows],
+                                     animated=self.blit))
+        # Annotate activity name in the middle of each segment
+        self.labels = [
+            self.ax.text(col, y + height / 2, activities[row], ha='center', va='center', fontsize=8,
+                         color='white', rotation=90, animated=self.blit)
+            for row, col, height, y in zip(rows, cols, heights, bottoms)
+        ]
+
+        # Set labels and title
+        self.ax.set_xlim(-0.6, len(categories) - 0.4)
+        self.ax.set_title(self.title, fontsize=14)
+        self.ax.set_ylabel('Hours', fontsize=12)
+        self.ax.set_xticks(x)
+        self.ax.set_xticklabels(categories, fontsize=10, rotation=45, ha='right')
+        self.ax.figure.tight_layout()
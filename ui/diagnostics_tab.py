@@ -0,0 +1,90 @@
+import tkinter as tk
+from tkinter import ttk
+from tkinter import filedialog
+from tkinter import messagebox
+from instrumentation import METRICS
+
+class DiagnosticsTab(ttk.Frame):
+    """
+    Shows where time goes: timed calls (DataManager methods, Garmin requests,
+    chart drawing), the costliest SQL statements and the slow-query log with
+    query plans. Numbers are re-read whenever the tab is selected.
+    """
+    # SQL statements listed, costliest first
+    QUERY_LIMIT = 50
+
+    def __init__(self, parent, data_manager):
+        super().__init__(parent)
+        self.data_manager = data_manager
+
+        buttons = ttk.Frame(self)
+        buttons.grid(row=0, column=0, sticky="ew", padx=10, pady=5)
+        ttk.Button(buttons, text="Refresh", command=self.refresh).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Reset", command=self.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Export...", command=self.export).pack(side=tk.LEFT)
+        self.cache_label = ttk.Label(buttons)
+        self.cache_label.pack(side=tk.LEFT, padx=10)
+
+        self.timing_tree = self.create_tree(1, ("name", "count", "mean", "p95", "max", "total"),
+                                            (220, 60, 70, 70, 70, 80), height=8)
+        self.query_tree = self.create_tree(2, ("sql", "count", "mean", "max", "total"),
+                                           (380, 60, 70, 70, 80), height=6)
+
+        ttk.Label(self, text="Slow queries").grid(row=3, column=0, sticky="w", padx=10)
+        self.slow_text = tk.Text(self, height=8, wrap="none", state="disabled")
+        self.slow_text.grid(row=4, column=0, sticky="nsew", padx=10, pady=5)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(4, weight=1)
+
+        self.refresh()
+
+    def create_tree(self, row, columns, widths, height):
+        tree = ttk.Treeview(self, columns=columns, show="headings", height=height)
+        for column, width in zip(columns, widths):
+            tree.heading(column, text=column.title())
+            tree.column(column, width=width, anchor="w" if column in ("name", "sql") else "e")
+        tree.grid(row=row, column=0, sticky="nsew", padx=10, pady=5)
+        return tree
+
+    def refresh(self):
+        snapshot = METRICS.snapshot()
+        stats = self.data_manager.cache_stats()
+        self.cache_label.configure(
+            text=f"Query cache: {stats['size']}/{stats['maxsize']} entries, "
+                 f"{stats['hit_rate']:.0%} hits, {stats['invalidations']} invalidated")
+
+        self.timing_tree.delete(*self.timing_tree.get_children())
+        timings = sorted(snapshot['timings'].items(), key=lambda item: -item[1]['total_ms'])
+        for name, timing in timings:
+            self.timing_tree.insert("", tk.END, values=(
+                name, timing['count'], f"{timing['mean_ms']:.2f}", f"{timing['p95_ms']:.2f}",
+                f"{timing['max_ms']:.2f}", f"{timing['total_ms']:.1f}"))
+
+        self.query_tree.delete(*self.query_tree.get_children())
+        for query in snapshot['queries'][:self.QUERY_LIMIT]:
+            self.query_tree.insert("", tk.END, values=(
+                query['sql'], query['count'], f"{query['mean_ms']:.2f}", f"{query['max_ms']:.2f}",
+                f"{query['total_ms']:.1f}"))
+
+        lines = []
+        for entry in reversed(snapshot['slow_queries']):
+            lines.append(f"{entry['time']}  {entry['ms']:.1f} ms  [{entry['thread']}]  {entry['sql']}")
+            lines.extend(f"    {step}" for step in entry['plan'] or ())
+        self.slow_text.configure(state="normal")
+        self.slow_text.delete("1.0", tk.END)
+        self.slow_text.insert("1.0", "\n".join(lines) or "No statements slower than "
+                                                        f"{METRICS.slow_query_ms:.0f} ms yet.")
+        self.slow_text.configure(state="disabled")
+
+    def reset(self):
+        METRICS.reset()
+        self.refresh()
+
+    def export(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            METRICS.export(path, cache=self.data_manager.cache_stats())
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not export metrics: {e}")
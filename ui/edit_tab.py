@@ -1,29 +1,42 @@
 import tkinter as tk
 from tkinter import ttk
+from tkinter import filedialog
 from tkinter import messagebox
-from data.data_manager import DataManager
 from datetime import datetime
-import re
+from data.transfer import read_records, write_records
+from instrumentation import timed
+from ui.refresh import RefreshOnChange
+from ui.sync_controls import GarminSyncControls
 
-class EditTab(ttk.Frame):
-    def __init__(self, parent, garminRequest):
+TRANSFER_FILETYPES = [("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Parquet", "*.parquet")]
+# Rows per import commit: a few seconds of write lock at most, and as fast
+# as one transaction since bigger chunks sort into longer date runs
+IMPORT_CHUNK_ROWS = 50000
+
+class EditTab(RefreshOnChange, ttk.Frame):
+    def __init__(self, parent, data_manager, garmin_sync, runner, queries):
         super().__init__(parent)
-        self.garminRequest = garminRequest
-        self.data_manager = DataManager()
+        self.garmin_sync = garmin_sync
+        self.data_manager = data_manager
+        self.runner = runner
+        self.queries = queries  # ui.async_data.AsyncDataManager
 
         # Variables to hold form data
         self.date_var = tk.StringVar()
         self.activity_var = tk.StringVar()  # To store the activity name
         self.category_var = tk.StringVar()  # To store the category name
         self.duration_var = tk.DoubleVar()
-        self.selected_activity = tk.StringVar()
+        # id -> (activity, category, duration, source_id) of the rows in the list
+        self.activities = {}
+        # Garmin details of the selected record, fetched when it is first opened
+        self.details_var = tk.StringVar()
+        self.details_task = None
 
         # Select Date - with Combobox and manual Entry
         ttk.Label(self, text="Select or Input Date:").grid(row=0, column=0, padx=10, pady=5)
 
         # Date Combobox
         self.date_combobox = ttk.Combobox(self, textvariable=self.date_var)
-        self.update_dates()
         self.date_combobox.grid(row=0, column=1, padx=10, pady=5)
         self.date_combobox.bind("<<ComboboxSelected>>", self.update_activity_list)
 
@@ -33,7 +46,8 @@ class EditTab(ttk.Frame):
         self.manual_date_entry.grid(row=1, column=1, padx=10, pady=5)
         self.manual_date_entry.bind("<Return>", self.update_activity_list)  # Bind the Enter key to trigger update
 
-        ttk.Button(self, text="Sync Garmin Activities", command=self.sync_garmin).grid(row=1, column=2, padx=10, pady=5)
+        self.sync_controls = GarminSyncControls(self, runner, self.garmin_sync.sync_day, self.get_sync_args, on_synced=self.on_synced)
+        self.sync_controls.grid(row=1, column=2, padx=10, pady=5)
 
         # Category Entry
         ttk.Label(self, text="Category:").grid(row=2, column=0, padx=10, pady=5)
@@ -49,86 +63,205 @@ class EditTab(ttk.Frame):
         ttk.Label(self, text="Duration (hours):").grid(row=4, column=0, padx=10, pady=5)
         ttk.Entry(self, textvariable=self.duration_var).grid(row=4, column=1, padx=10, pady=5)
 
-        # List of Activities
+        # List of Activities, one row per record keyed by its database id
         ttk.Label(self, text="Activities on Selected Date:").grid(row=5, column=0, padx=10, pady=5)
-        self.activity_listbox = tk.Listbox(self, listvariable=self.selected_activity, selectmode=tk.SINGLE)
-        self.activity_listbox.grid(row=5, column=1, padx=10, pady=5)
-        self.activity_listbox.bind("<<ListboxSelect>>", self.populate_activity_details)
+        list_frame = ttk.Frame(self)
+        list_frame.grid(row=5, column=1, columnspan=2, padx=10, pady=5, sticky="nsew")
+        self.activity_tree = ttk.Treeview(list_frame, columns=("category", "activity", "duration"),
+                                          show="headings", selectmode="browse", height=8)
+        self.activity_tree.heading("category", text="Category")
+        self.activity_tree.heading("activity", text="Activity")
+        self.activity_tree.heading("duration", text="Hours")
+        self.activity_tree.column("duration", width=60, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.activity_tree.yview)
+        self.activity_tree.configure(yscrollcommand=scrollbar.set)
+        self.activity_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self.activity_tree.bind("<<TreeviewSelect>>", self.populate_activity_details)
 
         # Buttons for Add, Edit, Remove Actions
         ttk.Button(self, text="Add Record", command=self.add_record).grid(row=6, column=0, pady=10)
         ttk.Button(self, text="Edit Record", command=self.edit_record).grid(row=6, column=1, pady=10)
         ttk.Button(self, text="Remove Record", command=self.remove_record).grid(row=6, column=2, pady=10)
 
+        # Backfill a range of Garmin history in one go
+        self.backfill_start_var = tk.StringVar()
+        self.backfill_end_var = tk.StringVar()
+        ttk.Label(self, text="Backfill From / To (YYYY-MM-DD):").grid(row=7, column=0, padx=10, pady=5)
+        backfill_frame = ttk.Frame(self)
+        backfill_frame.grid(row=7, column=1, padx=10, pady=5)
+        ttk.Entry(backfill_frame, textvariable=self.backfill_start_var, width=11).pack(side=tk.LEFT)
+        ttk.Entry(backfill_frame, textvariable=self.backfill_end_var, width=11).pack(side=tk.LEFT)
+        self.backfill_controls = GarminSyncControls(self, runner, self.garmin_sync.backfill, self.get_backfill_args,
+                                                    on_synced=self.on_synced, text="Backfill range")
+        self.backfill_controls.grid(row=7, column=2, padx=10, pady=5)
+
+        # Bulk import/export, run in the background
+        transfer_frame = ttk.Frame(self)
+        transfer_frame.grid(row=8, column=1, padx=10, pady=5)
+        ttk.Button(transfer_frame, text="Import...", command=self.import_file).pack(side=tk.LEFT)
+        ttk.Button(transfer_frame, text="Export...", command=self.export_file).pack(side=tk.LEFT)
+
+        ttk.Label(self, text="Garmin Details:").grid(row=9, column=0, padx=10, pady=5)
+        ttk.Label(self, textvariable=self.details_var).grid(row=9, column=1, columnspan=2, padx=10, pady=5, sticky="w")
+
+        self.refresh()
+
     def update_dates(self):
         """Updates the combobox with available dates from the database."""
-        dates = self.data_manager.get_dates()
+        self.queries.call('dates', 'get_dates', on_done=self.show_dates)
+
+    def show_dates(self, dates):
         self.date_combobox['values'] = dates
 
-    def sync_garmin(self):
-        selected_date = self.date_var.get()
-        parsed_data = None
-        try:
-            parsed_data = datetime.strptime(selected_date, "%Y-%m-%d").date()
-        except:
-            messagebox.showwarning("Input Error", "Please enter a valid date.")
-            return
-        activities = self.garminRequest.request_date(parsed_data)
-        existingActivities = self.data_manager.get_activities_by_date(selected_date)
-        print("he: ", existingActivities)
+    @staticmethod
+    def parse_date(text):
+        """Returns text as a date, or None if it is not YYYY-MM-DD."""
         try:
-            for a in activities:
-                actTuple = ("", a[0], a[1])
-                print(actTuple)
-                if actTuple in existingActivities:
-                    continue
-                self.data_manager.add_activity(selected_date, "", a[1], category=a[0])
-                self.update_activity_list()  # Refresh the list
-            messagebox.showinfo("Success", "Sync with Garmin Successful")
-        except:
-            messagebox.showinfo("Failure", "Something went wrong!")
-            
+            return datetime.strptime(text, "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+    def get_sync_args(self):
+        day = self.parse_date(self.date_var.get())
+        return None if day is None else (day,)
+
+    def get_backfill_args(self):
+        start = self.parse_date(self.backfill_start_var.get())
+        end = self.parse_date(self.backfill_end_var.get())
+        if start is None or end is None or start > end:
+            return None
+        return (start, end)
+
+    def on_synced(self):
+        # Refresh once per sync rather than once per inserted activity
+        self.reload()
+
+    def load(self):
+        self.update_dates()
+        self.update_activity_list()
 
     def update_activity_list(self, event=None):
-        """Updates the activity list based on the selected or entered date."""
-        selected_date = self.date_var.get()
-        self.activity_listbox.delete(0, tk.END)  # Clear the listbox first
-        if selected_date:
-            activities = self.data_manager.get_activities_by_date(selected_date)
-            if activities:
-                for activity, category, duration in activities:
-                    self.activity_listbox.insert(tk.END, f"{category}: {activity} ({duration} hrs)")
+        """Loads the activity list for the selected or entered date in the background."""
+        # Anything but a YYYY-MM-DD date lists nothing, as get_dates() never offers one
+        selected_date = self.parse_date(self.date_var.get())
+        if selected_date is not None:
+            self.queries.call('activities', 'get_activities_by_date', str(selected_date),
+                              on_done=self.show_activities)
+        else:
+            self.queries.cancel('activities')
+            self.show_activities([])
+
+    @timed()
+    def show_activities(self, rows):
+        self.activity_tree.delete(*self.activity_tree.get_children())  # Clear the list first
+        self.activities = {}
+        self.load_details(None)
+        for activity_id, activity, category, duration, source_id in rows:
+            self.activities[activity_id] = (activity, category, duration, source_id)
+            self.activity_tree.insert("", tk.END, iid=str(activity_id), values=(category, activity, duration))
+
+    def write(self, method, *args, success, failure, **kwargs):
+        """Runs a DataManager write in the background, then reloads the list and reports the outcome."""
+        def on_done(result):
+            # Dates too, as the write may have added or emptied one
+            self.reload()
+            # The by-id writes return False when the record is gone, e.g.
+            # removed by a sync or another process since the list was loaded
+            if result is False:
+                messagebox.showerror("Error", f"{failure}: the record no longer exists")
             else:
-                self.activity_listbox.insert(tk.END, "No activities found")
+                messagebox.showinfo("Success", success)
+
+        self.queries.call(None, method, *args, **kwargs, on_done=on_done,
+                          on_error=lambda e: messagebox.showerror("Error", f"{failure}: {e}"))
+
+    def get_selected_id(self):
+        """Returns the id of the selected record, or None."""
+        selection = self.activity_tree.selection()
+        return int(selection[0]) if selection else None
 
     def populate_activity_details(self, event=None):
         """Populates activity details when an activity is selected."""
-        try:
-            index = self.activity_listbox.curselection()[0]
-            selected = self.activity_listbox.get(index)
-            if "No activities found" in selected:
-                return
+        activity_id = self.get_selected_id()
+        if activity_id is None:
+            return
+        activity, category, duration, source_id = self.activities[activity_id]
+        self.category_var.set(category)
+        self.activity_var.set(activity)
+        self.duration_var.set(duration)
+        self.load_details(source_id)
+
+    def get_selected_source_id(self):
+        activity_id = self.get_selected_id()
+        return None if activity_id is None else self.activities[activity_id][3]
 
-            category_activity, duration = selected.split(" (")
-            category, activity_name = category_activity.split(": ")
-            duration = float(duration.split()[0])
+    def load_details(self, source_id):
+        """Shows the stored Garmin details of the selected record, fetching them the first time."""
+        if self.details_task is not None:
+            self.details_task.cancel()
+            self.details_task = None
+        if source_id is None:
+            self.queries.cancel('details')
+            self.show_details(None)
+            return
+        self.details_var.set("Loading...")
+        self.queries.call('details', 'get_activity_details', source_id,
+                          on_done=lambda details: self.on_details_loaded(source_id, details))
+
+    def on_details_loaded(self, source_id, details):
+        if source_id != self.get_selected_source_id():
+            return
+        if details is not None:
+            self.show_details(details)
+            return
+        # Not fetched yet; the request goes to the sync runner so it doesn't hold up queries
+        self.details_var.set("Fetching from Garmin...")
+        version = self.data_manager.data_version()
+        self.details_task = self.runner.submit(
+            self.garmin_sync.fetch_details, source_id,
+            on_done=lambda details: self.on_details_fetched(source_id, details, version),
+            on_error=lambda e: self.on_details_fetched(source_id, None, version, e))
 
-            self.category_var.set(category.strip())
-            self.activity_var.set(activity_name.strip())
-            self.duration_var.set(duration)
-        except IndexError:
-            pass
+    def on_details_fetched(self, source_id, details, version_before, error=None):
+        if source_id != self.get_selected_source_id():
+            return  # Another record was selected meanwhile
+        self.details_task = None
+        if error is not None:
+            self.details_var.set(f"Could not fetch Garmin details: {error}")
+        elif details is not None:
+            # Storing them was a write that changed nothing else on the tab
+            self.reload_after_write(version_before, lambda: self.show_details(details))
+
+    def show_details(self, details):
+        """Shows DataManager.ActivityDetails, or clears the details when None."""
+        if details is None:
+            self.details_var.set("")
+            return
+        parts = []
+        if details.average_hr is not None:
+            parts.append(f"avg HR {details.average_hr:.0f} bpm")
+        if details.max_hr is not None:
+            parts.append(f"max HR {details.max_hr:.0f} bpm")
+        if details.distance_km:
+            parts.append(f"{details.distance_km:.2f} km")
+        if details.calories is not None:
+            parts.append(f"{details.calories:.0f} kcal")
+        splits = (details.payload.get("splits") or {}).get("lapDTOs") or []
+        if splits:
+            parts.append(f"{len(splits)} splits")
+        self.details_var.set(", ".join(parts) or "No metrics recorded")
 
     def add_record(self):
         """Adds a new record."""
-        selected_date = self.date_var.get()
+        selected_date = self.parse_date(self.date_var.get())
         category = self.category_var.get()
         activity = self.activity_var.get()
         duration = self.duration_var.get()
 
         # Validate all fields
-        if not selected_date:
-            messagebox.showwarning("Input Error", "Please enter a valid date.")
+        if selected_date is None:
+            messagebox.showwarning("Input Error", "Please enter a date as YYYY-MM-DD.")
         elif not category:
             messagebox.showwarning("Input Error", "Please enter a category.")
         elif not activity:
@@ -136,48 +269,54 @@ class EditTab(ttk.Frame):
         elif duration <= 0:
             messagebox.showwarning("Input Error", "Please enter a valid duration.")
         else:
-            try:
-                self.data_manager.add_activity(selected_date, activity, duration, category=category)
-                self.update_activity_list()  # Refresh the list
-                messagebox.showinfo("Success", "Activity added successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to add activity: {str(e)}")
+            self.write('add_activity', str(selected_date), activity, duration, category=category,
+                       success="Activity added successfully!", failure="Failed to add activity")
 
     def edit_record(self):
-        """Edits an existing record."""
-        selected_date = self.date_var.get()
+        """Edits the selected record."""
+        activity_id = self.get_selected_id()
         activity = self.activity_var.get()
         category = self.category_var.get()
         duration = self.duration_var.get()
 
-        if selected_date and activity and duration > 0:
-            try:
-                self.data_manager.edit_activity(selected_date, activity, category, duration)
-                self.update_activity_list()  # Refresh the list
-                messagebox.showinfo("Success", "Activity edited successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to edit activity: {str(e)}")
+        if activity_id is not None and activity and duration > 0:
+            self.write('edit_activity_by_id', activity_id, activity, duration, category=category,
+                       success="Activity edited successfully!", failure="Failed to edit activity")
         else:
             messagebox.showwarning("Input Error", "Please select an activity and fill all fields correctly.")
 
     def remove_record(self):
-        """Removes a selected record."""
-        selected_date = self.date_var.get()
-        if selected_date:
-            try:
-                index = self.activity_listbox.curselection()[0]
-                selected = self.activity_listbox.get(index)
-                if "No activities found" in selected:
-                    return
-
-                dur = float(re.search(r"[\d.]+", selected).group())
-                activity_name = selected.split(": ")[1].split(" (")[0].strip()
-
-                self.data_manager.remove_activity(selected_date, activity_name, dur)
-                self.update_activity_list()  # Refresh the list
-                messagebox.showinfo("Success", "Activity removed successfully!")
-            except IndexError:
-                messagebox.showwarning("Input Error", "Please select an activity to remove.")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to remove activity: {str(e)}")
+        """Removes the selected record."""
+        activity_id = self.get_selected_id()
+        if activity_id is None:
+            messagebox.showwarning("Input Error", "Please select an activity to remove.")
+            return
+        self.write('remove_activity_by_id', activity_id,
+                   success="Activity removed successfully!", failure="Failed to remove activity")
+
+    def import_file(self):
+        path = filedialog.askopenfilename(title="Import activities", filetypes=TRANSFER_FILETYPES)
+        if not path:
+            return
+        # Committed a chunk at a time so edits and syncs aren't locked out for the whole import
+        self.runner.submit(lambda task: self.data_manager.import_activities(
+                               read_records(path), chunk_size=IMPORT_CHUNK_ROWS, atomic=False),
+                           on_done=self.on_imported, on_error=self.on_import_failed)
+
+    def on_import_failed(self, error):
+        # The records before the failing one were written
+        self.reload()
+        messagebox.showerror("Error", f"Import stopped: {error}. Records before it were imported.")
 
+    def on_imported(self, count):
+        self.reload()
+        messagebox.showinfo("Success", f"Imported {count} activities")
+
+    def export_file(self):
+        path = filedialog.asksaveasfilename(title="Export activities", filetypes=TRANSFER_FILETYPES,
+                                            defaultextension=".csv")
+        if not path:
+            return
+        self.runner.submit(lambda task: write_records(path, self.data_manager.export_activities()),
+                           on_done=lambda count: messagebox.showinfo("Success", f"Exported {count} activities"),
+                           on_error=lambda e: messagebox.showerror("Error", f"Export failed: {e}"))
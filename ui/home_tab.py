@@ -1,17 +1,23 @@
 import tkinter as tk
 from tkinter import ttk
-from tkinter import messagebox
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-from data.data_manager import DataManager
-import numpy as np
-from datetime import date, datetime
-
-class HomeTab(ttk.Frame):
-    def __init__(self, parent, garminRequest):
+from ui.sync_controls import GarminSyncControls
+from datetime import date
+from data.data_manager import CATEGORY_GROUPS
+from instrumentation import timed
+from ui.refresh import RefreshOnChange
+
+class HomeTab(RefreshOnChange, ttk.Frame):
+    # Today's chart and KPIs, and the rolling averages ending today
+    DEPENDS_ON_TODAY = True
+    # Wait this long after the last keystroke before searching categories
+    SEARCH_DELAY_MS = 150
+    SEARCH_LIMIT = 50
+
+    def __init__(self, parent, data_manager, garmin_sync, runner, queries):
         super().__init__(parent)
-        self.garminRequest = garminRequest
-        self.data_manager = DataManager()
+        self.garmin_sync = garmin_sync
+        self.data_manager = data_manager
+        self.queries = queries  # ui.async_data.AsyncDataManager
 
         self.activity_var = tk.StringVar()
         self.duration_var = tk.DoubleVar()
@@ -23,10 +29,15 @@ class HomeTab(ttk.Frame):
         self.update_categories()
         self.category_combobox.grid(row=0, column=1, padx=10, pady=10)
         self.category_combobox.bind("<KeyRelease>", self.on_category_search)
+        self.category_combobox.bind("<<ComboboxSelected>>", self.show_category_group)
+        self.pending_search = None
 
         # Button to add new category
         ttk.Button(self, text="Add New Category", command=self.add_category).grid(row=0, column=2, padx=10, pady=10)
-        ttk.Button(self, text="Sync Garmin Activities", command=self.sync_garmin).grid(row=3, column=1, padx=10, pady=10)
+        self.sync_controls = GarminSyncControls(
+            self, runner, self.garmin_sync.sync_day, lambda: (date.today(),),
+            on_synced=self.on_synced)
+        self.sync_controls.grid(row=3, column=1, padx=10, pady=10)
 
         # Entry for recording new activity
         ttk.Label(self, text="Activity Name:").grid(row=1, column=0, padx=10, pady=10)
@@ -37,156 +48,143 @@ class HomeTab(ttk.Frame):
 
         ttk.Button(self, text="Add Record", command=self.add_record).grid(row=3, column=0, columnspan=1, pady=10)
 
+        # Which KPI group the selected category counts towards
+        ttk.Label(self, text="KPI Group:").grid(row=5, column=0, padx=10, pady=10)
+        self.group_var = tk.StringVar()
+        self.group_combobox = ttk.Combobox(self, textvariable=self.group_var, state="readonly",
+                                           values=("",) + CATEGORY_GROUPS)
+        self.group_combobox.grid(row=5, column=1, padx=10, pady=10)
+        ttk.Button(self, text="Set Group", command=self.set_category_group).grid(row=5, column=2, padx=10, pady=10)
+
         # KPIs
-        self.total_ptime_label = ttk.Label(self, text=f"Total Productive time: {0}")
-        self.total_ptime_label.grid(row=0, column = 3, padx = 10, pady=10)
-        self.extime_label = ttk.Label(self, text=f"Total Exercise time: {0}")
-        self.extime_label.grid(row=1, column = 3, padx = 10, pady=10)
-        self.imtime_label = ttk.Label(self, text=f"Total Improvement time: {0}")
-        self.imtime_label .grid(row=2, column = 3, padx = 10, pady=10)
-        self.prod_ratio = ttk.Label(self, text=f"Productivity Ratio: {0}")
-        self.prod_ratio.grid(row=2, column = 3, padx = 10, pady=10)
-
-        # Plot area for displaying current day's stacked bar chart
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100)
+        kpi_frame = ttk.Frame(self)
+        kpi_frame.grid(row=0, column=3, rowspan=4, padx=10, pady=10, sticky="n")
+        self.total_ptime_label = ttk.Label(kpi_frame, text=f"Total Productive time: {0}")
+        self.extime_label = ttk.Label(kpi_frame, text=f"Total Exercise time: {0}")
+        self.imtime_label = ttk.Label(kpi_frame, text=f"Total Improvement time: {0}")
+        self.prod_ratio = ttk.Label(kpi_frame, text=f"Productivity Ratio: {0}")
+        self.average_label = ttk.Label(kpi_frame)
+        self.streak_label = ttk.Label(kpi_frame)
+        for label in (self.total_ptime_label, self.extime_label, self.imtime_label, self.prod_ratio,
+                      self.average_label, self.streak_label):
+            label.pack(anchor="w", pady=2)
+        # data.analytics.Analytics, created with the first KPI update as it needs NumPy.
+        # Only used from the query thread, which serializes its loads and updates
+        self.analytics = None
+
+        # Plot area for displaying current day's stacked bar chart, created on first draw
+        self.canvas = None
+
+        self.refresh()
+
+    def create_chart(self):
+        # matplotlib is slow to import, so it is only loaded once a chart is shown
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from ui.charts import StackedBarChart
+
+        self.figure = Figure(figsize=(5, 4), dpi=100)
         self.ax = self.figure.add_subplot(111)
+        self.chart = StackedBarChart(self.ax, 'Stacked Time Spent Today by Categories', blit=True)
         self.canvas = FigureCanvasTkAgg(self.figure, self)
+        # draw_idle() paints later from Tk's idle loop, so the paint is timed on its own
+        self.canvas.draw = timed('HomeTab.canvas.draw')(self.canvas.draw)
         self.canvas.get_tk_widget().grid(row=4, column=0, columnspan=3)
-
-        self.update_chart()
-        self.update_kpis()
     
     def on_category_search(self, event):
-        search_term = self.category_var.get().lower()
-        categories = self.data_manager.search_categories(search_term)
+        # Debounce: only search once typing pauses
+        if self.pending_search is not None:
+            self.after_cancel(self.pending_search)
+        self.pending_search = self.after(self.SEARCH_DELAY_MS, self.run_category_search)
+
+    def run_category_search(self):
+        self.pending_search = None
+        search_term = self.category_var.get()
+        self.queries.call('category_search', 'search_categories', search_term, limit=self.SEARCH_LIMIT,
+                          on_done=self.show_categories)
+
+    def show_categories(self, categories):
         self.category_combobox['values'] = categories
 
-    def sync_garmin(self):
-        selected_date = str(date.today())
-        parsed_data = None
-        try:
-            parsed_data = datetime.strptime(selected_date, "%Y-%m-%d").date()
-        except:
-            messagebox.showwarning("Input Error", "Please enter a valid date.")
-            return
-        activities = self.garminRequest.request_date(parsed_data)
-        existingActivities = self.data_manager.get_activities_by_date(selected_date)
-        try:
-            for a in activities:
-                actTuple = ("", a[0], a[1])
-                print(actTuple)
-                if actTuple in existingActivities:
-                    continue
-                self.data_manager.add_activity(selected_date, "", a[1], category=a[0])
-                self.update_chart()  # Refresh the list
-            messagebox.showinfo("Success", "Sync with Garmin Successful")
-        except:
-            messagebox.showinfo("Failure", "Something went wrong!")
-    
+    def on_synced(self):
+        # Redraw once per sync rather than once per inserted activity
+        self.reload()
+
     def add_category(self):
         new_category = self.category_var.get()
         if new_category:
-            self.data_manager.add_category(new_category)
-            self.update_categories()
+            version = self.data_manager.data_version()
+            self.queries.call(None, 'add_category', new_category,
+                              on_done=lambda _: self.reload_after_write(version, self.update_categories))
 
     def update_categories(self):
-        categories = self.data_manager.get_categories()
-        self.category_combobox['values'] = categories
+        self.queries.call('categories', 'get_categories', on_done=self.show_categories)
+
+    def show_category_group(self, event=None):
+        category = self.category_var.get()
+        self.queries.call('category_group', 'get_category_groups',
+                          on_done=lambda groups: self.group_var.set(groups.get(category, "")))
+
+    def set_category_group(self):
+        category = self.category_var.get()
+        if category:
+            version = self.data_manager.data_version()
+            self.queries.call(None, 'set_category_group', category, self.group_var.get() or None,
+                              on_done=lambda _: self.reload_after_write(version, self.update_kpis))
 
     def add_record(self):
         category = self.category_var.get()
         activity = self.activity_var.get()
         duration = self.duration_var.get()
         if activity and duration > 0 and category:
-            self.data_manager.add_today_activity(category, activity, duration)
-            self.update_chart()
-
-    @staticmethod
-    def get_current_hours_passed():
-        now = datetime.now()
-        hours = now.hour
-        minutes = now.minute
-        # Convert minutes to a fraction of an hour
-        fractional_hours = minutes / 60
-        # Total hours passed in the day
-        total_hours = hours + fractional_hours
-        return total_hours
+            self.queries.run(None, self.write_record, category, activity, duration, on_done=lambda _: self.on_synced())
+
+    def write_record(self, category, activity, duration):
+        """Runs on the query thread."""
+        version = self.data_manager.data_version()
+        self.data_manager.add_today_activity(category, activity, duration)
+        if self.analytics is not None:
+            # Folds the new record into the loaded KPIs instead of reloading them
+            self.analytics.record(date.today(), category, duration, version)
 
     def update_kpis(self):
-        tTime, imTime, exTime = self.parseActivities()
-        self.total_ptime_label.configure(text=f"Total Productive time: {tTime} hours")
-        self.extime_label.configure(text=f"Total Exercise time: {exTime} hours")
-        self.imtime_label.configure(text=f"Total Improvement time: {imTime} hours")
-        self.prod_ratio.configure(text=f"Total productivity/tracked: {tTime / self.get_current_hours_passed()}")
-
-    def parseActivities(self):
-        # Returns (total_prod_time, total_improvement_time, total_ex_time)
-        data = self.data_manager.get_today_activities_grouped_by_category()
-        exCats = []
-        imCats = []
-        exTime = 0
-        tTime = 0
-        imTime = 0
-        for cat in data:
-            for _, duration in data[cat]:
-                if cat in exCats:
-                    exTime += duration
-                if cat in imCats:
-                    imTime += duration
-                tTime += duration
-        return (tTime, imTime, exTime)
+        self.queries.run('kpis', self.load_kpis, on_done=self.show_kpis)
+
+    @timed()
+    def load_kpis(self):
+        """Runs on the query thread; returns the KPI values show_kpis displays."""
+        if self.analytics is None:
+            from data.analytics import Analytics
+            self.analytics = Analytics(self.data_manager)
+        self.analytics.refresh()
+        kpis = self.analytics.today()
+        kpis['average_7'] = self.analytics.rolling_average('productive', 7)[-1]
+        kpis['average_30'] = self.analytics.rolling_average('productive', 30)[-1]
+        kpis['streak'], kpis['longest_streak'] = self.analytics.streaks('productive')
+        return kpis
+
+    def show_kpis(self, kpis):
+        self.total_ptime_label.configure(text=f"Total Productive time: {kpis['productive']:.2f} hours")
+        self.extime_label.configure(text=f"Total Exercise time: {kpis['exercise']:.2f} hours")
+        self.imtime_label.configure(text=f"Total Improvement time: {kpis['improvement']:.2f} hours")
+        self.prod_ratio.configure(text=f"Total productivity/tracked: {kpis['ratio']:.2f}")
+        self.average_label.configure(text=f"Productive average: {kpis['average_7']:.2f} h/day (7d), "
+                                          f"{kpis['average_30']:.2f} h/day (30d)")
+        self.streak_label.configure(text=f"Productive streak: {kpis['streak']} days "
+                                         f"(longest {kpis['longest_streak']})")
+
+    def load(self):
+        self.update_chart()
+        self.update_kpis()
 
     def update_chart(self):
-        # Get today's activity data grouped by categories
-        data = self.data_manager.get_today_activities_grouped_by_category()
-
-        # Clear the previous plot
-        self.ax.clear()
-        
-        categories = list(data.keys())
-        activities = {}
-
-        # Collect activity names and their durations by category
-        for category, activities_data in data.items():
-            for activity, duration in activities_data:
-                if activity not in activities:
-                    activities[activity] = [0] * len(categories)
-                activities[activity][categories.index(category)] = duration
-
-        # Define a color map (or you can manually assign colors if preferred)
-        colors = plt.cm.get_cmap('tab20', len(categories))  # Using colormap for consistent category coloring
-
-        # Initialize bottom positions for stacking
-        bottom_values = np.zeros(len(categories))
-
-        # Plot stacked bar chart
-        for i, (activity, durations) in enumerate(activities.items()):
-            bars = self.ax.bar(categories, durations, bottom=bottom_values, label=activity, color=colors(i))
-
-            # Annotate activity name on top of each bar
-            for bar in bars:
-                height = bar.get_height()
-                if height > 0:
-                    self.ax.text(
-                        bar.get_x() + bar.get_width() / 2,  # X-coordinate
-                        bar.get_y() + height / 2,  # Y-coordinate (middle of the bar)
-                        f'{activity}',  # Activity name as label
-                        ha='center', va='center', fontsize=8, color='white', rotation=90
-                    )
-
-            # Update the bottom position for the next stacked bar
-            bottom_values += durations
-
-        # Set labels and title
-        self.ax.set_title('Stacked Time Spent Today by Categories', fontsize=14)
-        self.ax.set_ylabel('Hours', fontsize=12)
-        self.ax.set_xticks(np.arange(len(categories)))
-        self.ax.set_xticklabels(categories, fontsize=10, rotation=45, ha='right')
-
-        # Add legend
-        #self.ax.legend(title="Activities", bbox_to_anchor=(1.05, 1), loc='upper left')
-        self.figure.tight_layout()
-
-        # Draw the updated chart
-        self.canvas.draw()
-
+        # Today's activity data grouped by categories, drawn once loaded
+        self.queries.call('chart', 'get_today_activities_grouped_by_category', on_done=self.draw_chart)
+
+    @timed()
+    def draw_chart(self, data):
+        if self.canvas is None:
+            self.create_chart()
+        self.chart.update(data)
+        # Blits the moved bars, or repaints everything when Tk is next idle
+        self.chart.draw(self.canvas)
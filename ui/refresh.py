@@ -0,0 +1,52 @@
+from abc import ABC, abstractmethod
+from datetime import date
+
+class RefreshOnChange(ABC):
+    """
+    Mixin for tabs that show DataManager queries and are refreshed each time
+    they are selected. refresh() only reloads when the data changed since the
+    last load, or, for tabs whose queries are relative to today, the day did.
+
+    Tabs provide `data_manager` and load().
+    """
+    # Whether the tab's queries depend on date.today()
+    DEPENDS_ON_TODAY = False
+    # State the tab was last loaded at, see current_state()
+    rendered_state = None
+
+    def current_state(self):
+        """DataManager.data_version(), paired with the day for DEPENDS_ON_TODAY tabs."""
+        return self._state(self.data_manager.data_version())
+
+    def _state(self, version):
+        return (version, date.today()) if self.DEPENDS_ON_TODAY else version
+
+    def refresh(self):
+        """Reloads only if the data or the day changed since the last load."""
+        if self.current_state() != self.rendered_state:
+            self.reload()
+
+    def reload(self):
+        """Runs load() and records the state it loads at."""
+        # Recorded before querying so a write racing the reload triggers another one
+        self.rendered_state = self.current_state()
+        self.load()
+
+    def reload_after_write(self, version_before, *loaders):
+        """
+        Updates the tab after one of its own writes, given data_version()
+        from before it. If the tab was current and that write is the only
+        change since, runs just the loaders the write affects; otherwise
+        reloads everything, so other changes aren't taken as shown.
+        """
+        state = self.current_state()
+        if self.rendered_state != self._state(version_before) or state != self._state(version_before + 1):
+            self.reload()
+            return
+        self.rendered_state = state
+        for loader in loaders:
+            loader()
+
+    @abstractmethod
+    def load(self):
+        """Queries everything the tab shows."""
@@ -0,0 +1,117 @@
+"""
+Headless reports of the tracked time as PNG, JSON or CSV.
+
+Nothing here imports tkinter. Charts are drawn by the same ui.charts code the
+tabs use, onto an Agg canvas, so reports can run from cron or over SSH.
+"""
+import csv
+import json
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+from data.data_manager import period_labels
+
+REPORT_FORMATS = ('png', 'json', 'csv')
+# Range suffix -> days per unit
+RANGE_UNITS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+
+# summary: data.data_manager.Summary, activities: {category: [(activity, hours)]}
+Report = namedtuple('Report', ['name', 'start', 'end', 'granularity', 'summary', 'activities'])
+
+def parse_range(text, today=None):
+    """
+    Turns a range into (start, end) dates. '30d', '12w', '6m' and '1y' end
+    today and reach back that many days, like the Summary tab presets;
+    'YYYY-MM-DD:YYYY-MM-DD' is an explicit inclusive range.
+    """
+    today = today or date.today()
+    match = re.fullmatch(r'(\d+)([dwmy])', text.strip().lower())
+    if match:
+        return today - timedelta(days=int(match.group(1)) * RANGE_UNITS[match.group(2)]), today
+    try:
+        start, end = (date.fromisoformat(part) for part in text.split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid range {text!r}; use e.g. 30d, 12w, 6m, 1y or 2024-01-01:2024-03-31") from None
+    if start > end:
+        raise ValueError(f"Range {text!r} ends before it starts")
+    return start, end
+
+def auto_granularity(start, end, max_periods=None):
+    """
+    Picks day, week or month buckets so a chart of start..end stays readable.
+    With max_periods, picks the finest one giving at most that many bars,
+    e.g. as many as fit the width of the chart.
+    """
+    if max_periods is not None:
+        for granularity in ('day', 'week'):
+            if len(period_labels(start, end, granularity)) <= max_periods:
+                return granularity
+        return 'month'
+    days = (end - start).days + 1
+    if days <= 31:
+        return 'day'
+    if days <= 183:
+        return 'week'
+    return 'month'
+
+def build_report(data_manager, range_text, granularity=None):
+    start, end = parse_range(range_text)
+    granularity = granularity or auto_granularity(start, end)
+    return Report(range_text, start, end, granularity,
+                  data_manager.get_summary(start, end, granularity=granularity),
+                  data_manager.get_activities_grouped_by_category(start, end))
+
+def report_to_dict(report):
+    summary = report.summary
+    return {
+        'start': report.start.isoformat(),
+        'end': report.end.isoformat(),
+        'granularity': report.granularity,
+        'periods': summary.periods,
+        'categories': summary.categories,
+        # values[i][j] is the hours of categories[j] in periods[i]
+        'values': summary.values.tolist(),
+        'totals': dict(zip(summary.categories, summary.values.sum(axis=0).tolist())),
+        'activities': {category: dict(activities) for category, activities in report.activities.items()},
+    }
+
+def write_json(report, f):
+    json.dump(report_to_dict(report), f, indent=2)
+    f.write('\n')
+
+def write_csv(report, f):
+    """One row per period and category with time logged."""
+    writer = csv.writer(f)
+    writer.writerow(('period', 'category', 'hours'))
+    summary = report.summary
+    for period, hours in zip(summary.periods, summary.values):
+        for category, value in zip(summary.categories, hours):
+            if value:
+                writer.writerow((period, category, round(float(value), 4)))
+
+class ReportRenderer:
+    """
+    Draws reports to image files: hours per period on top, hours per category
+    stacked by activity below. The figure and charts are reused between
+    reports, so rendering many in one process does not rebuild them.
+    """
+    def __init__(self, figsize=(10, 8), dpi=100):
+        # matplotlib is only needed for images, so it is loaded here
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from ui.charts import StackedBarChart, draw_summary
+
+        self.draw_summary = draw_summary
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.summary_ax, activity_ax = self.figure.subplots(2, 1)
+        self.activity_chart = StackedBarChart(activity_ax, 'Hours by Category')
+
+    def render(self, report, path):
+        title = f'{report.start} to {report.end}'
+        self.draw_summary(self.summary_ax, report.summary, f'{title} ({report.granularity})')
+        self.activity_chart.update(report.activities)
+        self.activity_chart.ax.set_title(f'Hours by Category, {title}', fontsize=14)
+        self.figure.tight_layout()
+        self.figure.savefig(path)
@@ -1,52 +1,159 @@
 import tkinter as tk
 from tkinter import ttk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-from data.data_manager import DataManager
+from datetime import date, datetime, timedelta
+from instrumentation import timed, timer
+from ui.refresh import RefreshOnChange
+from ui.report import auto_granularity
 
-class SummaryTab(ttk.Frame):
-    def __init__(self, parent):
+# Summary range name -> number of days back from today
+RANGES = {"Last 7 Days": 7, "Last Month": 30, "Last 90 Days": 90, "Last Year": 365,
+          "Last 2 Years": 730, "Last 5 Years": 1825}
+CUSTOM_RANGE = "Custom Range"
+# None picks the bucket size from the range and the chart width
+GRANULARITIES = {"Auto": None, "Daily": "day", "Weekly": "week", "Monthly": "month"}
+# Narrowest bar, in pixels, that Auto buckets allow
+MIN_BAR_PX = 12
+
+class SummaryTab(RefreshOnChange, ttk.Frame):
+    # The "Last N days" ranges end today
+    DEPENDS_ON_TODAY = True
+
+    def __init__(self, parent, data_manager, queries):
         super().__init__(parent)
-        self.data_manager = DataManager()
+        self.data_manager = data_manager
+        self.queries = queries  # ui.async_data.AsyncDataManager
 
         # Create a dropdown to select the summary range (e.g., last 7 days, month, year)
         self.range_var = tk.StringVar()
-        self.range_combobox = ttk.Combobox(self, textvariable=self.range_var)
-        self.range_combobox['values'] = ["Last 7 Days", "Last Month", "Last Year"]
+        self.range_combobox = ttk.Combobox(self, textvariable=self.range_var, state="readonly")
+        self.range_combobox['values'] = list(RANGES) + [CUSTOM_RANGE]
         self.range_combobox.set("Last 7 Days")
         self.range_combobox.grid(row=0, column=0, padx=10, pady=10)
         self.range_combobox.bind("<<ComboboxSelected>>", self.update_chart)
 
-        # Plot area for displaying the summary data
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100)
+        # Bucket size for the bars
+        self.granularity_var = tk.StringVar()
+        self.granularity_combobox = ttk.Combobox(self, textvariable=self.granularity_var, state="readonly")
+        self.granularity_combobox['values'] = list(GRANULARITIES)
+        self.granularity_combobox.set("Auto")
+        self.granularity_combobox.grid(row=0, column=1, padx=10, pady=10)
+        self.granularity_combobox.bind("<<ComboboxSelected>>", self.update_chart)
+
+        # Custom range bounds (YYYY-MM-DD), used when "Custom Range" is selected
+        self.start_var = tk.StringVar(value=str(date.today() - timedelta(days=7)))
+        self.end_var = tk.StringVar(value=str(date.today()))
+        custom_frame = ttk.Frame(self)
+        custom_frame.grid(row=0, column=2, padx=10, pady=10)
+        ttk.Label(custom_frame, text="From:").pack(side=tk.LEFT)
+        start_entry = ttk.Entry(custom_frame, textvariable=self.start_var, width=11)
+        start_entry.pack(side=tk.LEFT)
+        ttk.Label(custom_frame, text="To:").pack(side=tk.LEFT)
+        end_entry = ttk.Entry(custom_frame, textvariable=self.end_var, width=11)
+        end_entry.pack(side=tk.LEFT)
+        for entry in (start_entry, end_entry):
+            entry.bind("<Return>", self.on_custom_range)
+
+        # Plot area for displaying the summary data, created on first draw; it
+        # grows with the window, and Auto buckets follow its width
+        self.canvas = None
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(2, weight=1)
+        self.pending_resize = None
+        # (date_range, granularity) the chart was last requested with
+        self.requested = None
+
+        self.refresh()
+
+    def create_chart(self):
+        # matplotlib is slow to import, so it is only loaded once a chart is shown
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(5, 4), dpi=100)
+        # Fixed room for the rotated period labels, instead of a tight_layout on every draw
+        self.figure.subplots_adjust(bottom=0.22)
         self.ax = self.figure.add_subplot(111)
         self.canvas = FigureCanvasTkAgg(self.figure, self)
-        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=2)
+        widget = self.canvas.get_tk_widget()
+        widget.grid(row=1, column=0, columnspan=3, sticky="nsew")
+        # Added to the binding through which FigureCanvasTkAgg resizes the figure
+        widget.bind("<Configure>", self.on_resize, add="+")
+
+    def chart_width(self):
+        """Width of the plot area in pixels; the figure's own width until it is on screen."""
+        if self.canvas is not None:
+            width = self.canvas.get_tk_widget().winfo_width()
+            if width > 1:
+                return width
+        return 500
+
+    def get_granularity(self, date_range):
+        granularity = GRANULARITIES[self.granularity_var.get()]
+        if granularity is None:
+            granularity = auto_granularity(*date_range, max_periods=self.chart_width() // MIN_BAR_PX)
+        return granularity
+
+    def on_resize(self, event=None):
+        # Debounced: re-bucket once the window stops changing size
+        if self.pending_resize is not None:
+            self.after_cancel(self.pending_resize)
+        self.pending_resize = self.after(200, self.rebucket)
 
+    def rebucket(self):
+        """Reloads the chart if the new width changes the Auto bucket size."""
+        self.pending_resize = None
+        date_range = self.get_date_range()
+        if date_range is not None and (date_range, self.get_granularity(date_range)) != self.requested:
+            self.update_chart()
+
+    def on_custom_range(self, event=None):
+        self.range_combobox.set(CUSTOM_RANGE)
+        self.update_chart()
+
+    def get_date_range(self):
+        """Returns (start, end) dates for the selected range, or None if invalid."""
+        summary_range = self.range_var.get()
+        if summary_range in RANGES:
+            end = date.today()
+            return end - timedelta(days=RANGES[summary_range]), end
+        try:
+            start = datetime.strptime(self.start_var.get(), "%Y-%m-%d").date()
+            end = datetime.strptime(self.end_var.get(), "%Y-%m-%d").date()
+        except ValueError:
+            return None
+        return (start, end) if start <= end else None
+
+    def load(self):
         self.update_chart()
 
     def update_chart(self, event=None):
-        # Determine the range for the summary
+        """Queries the selected range in the background; draw_chart shows it once loaded."""
         summary_range = self.range_var.get()
-        if summary_range == "Last 7 Days":
-            data = self.data_manager.get_last_7_days_summary()
-        elif summary_range == "Last Month":
-            data = self.data_manager.get_last_30_days_summary()
-        elif summary_range == "Last Year":
-            data = self.data_manager.get_last_365_days_summary()
-        else:
-            data = []
-
-        # Clear the chart and draw new data
-        self.ax.clear()
-        if data:
-            for day, activities in data.items():
-                self.ax.bar(day, [sum(activities.values())], label=f"{day}")
-            self.ax.set_title(f'{summary_range} Summary')
-            self.ax.set_ylabel('Total Hours')
-            self.ax.legend()
-        else:
-            self.ax.text(0.5, 0.5, "No Data Available", fontsize=12, ha='center')
+        date_range = self.get_date_range()
+        if date_range is None:
+            # Also drops a query still running for the previous range
+            self.queries.cancel('summary')
+            self.requested = None
+            self.draw_chart(summary_range, None)
+            return
+        granularity = self.get_granularity(date_range)
+        self.requested = (date_range, granularity)
+        self.queries.call('summary', 'get_summary', *date_range, granularity=granularity,
+                          on_done=lambda summary: self.draw_chart(summary_range, summary, granularity))
 
-        self.canvas.draw()
+    @timed()
+    def draw_chart(self, summary_range, summary, granularity=None):
+        """Draws summary, or the invalid range message when it is None."""
+        if self.canvas is None:
+            self.create_chart()
+        # Already loaded along with matplotlib by create_chart
+        from ui.charts import draw_summary
+
+        if summary is None:
+            self.ax.clear()
+            self.ax.text(0.5, 0.5, "Invalid Date Range", fontsize=12, ha='center')
+        else:
+            draw_summary(self.ax, summary, f'{summary_range} Summary, by {granularity}')
 
+        with timer('SummaryTab.canvas.draw'):
+            self.canvas.draw()
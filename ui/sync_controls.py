@@ -0,0 +1,63 @@
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+
+class GarminSyncControls(ttk.Frame):
+    """Sync button with a progress bar and cancel button, shared by the tabs."""
+    def __init__(self, parent, runner, job, get_args, on_synced, text="Sync Garmin Activities"):
+        super().__init__(parent)
+        self.runner = runner
+        self.job = job  # job(task, *args) returning the number of activities synced
+        self.get_args = get_args  # returns the job's args, or None if the input is invalid
+        self.on_synced = on_synced  # called once when a sync finishes
+        self.task = None
+
+        self.sync_button = ttk.Button(self, text=text, command=self.start)
+        self.sync_button.pack(side=tk.LEFT)
+        self.progress = ttk.Progressbar(self, length=100)
+        self.cancel_button = ttk.Button(self, text="Cancel", command=self.cancel)
+
+    def start(self):
+        args = self.get_args()
+        if args is None:
+            messagebox.showwarning("Input Error", "Please enter a valid date.")
+            return
+        self.sync_button.state(["disabled"])
+        self.progress.pack(side=tk.LEFT, padx=5)
+        self.cancel_button.pack(side=tk.LEFT)
+        # Indeterminate until Garmin has answered and the total is known
+        self.progress.configure(mode="indeterminate", value=0)
+        self.progress.start()
+        self.task = self.runner.submit(self.job, *args,
+                                       on_progress=self.on_progress, on_done=self.on_done,
+                                       on_error=self.on_error)
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def on_progress(self, done, total):
+        if str(self.progress.cget("mode")) == "indeterminate":
+            self.progress.stop()
+            self.progress.configure(mode="determinate", maximum=total)
+        self.progress.configure(value=done)
+
+    def finish(self):
+        cancelled = self.task.cancelled
+        self.task = None
+        self.progress.stop()
+        self.progress.pack_forget()
+        self.cancel_button.pack_forget()
+        self.sync_button.state(["!disabled"])
+        self.on_synced()
+        return cancelled
+
+    def on_done(self, synced):
+        if self.finish():
+            messagebox.showinfo("Cancelled", f"Sync cancelled after syncing {synced} activities")
+        else:
+            messagebox.showinfo("Success", f"Sync with Garmin Successful ({synced} activities synced)")
+
+    def on_error(self, error):
+        self.finish()
+        messagebox.showinfo("Failure", f"Something went wrong! {error}")